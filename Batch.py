@@ -0,0 +1,150 @@
+from collections import deque
+from itertools import islice
+import json
+import os
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, TextIO, Tuple, Union
+
+from Grammar import CompiledGrammar
+from Grammar_Lexer import Grammar_Lexer
+from Parser import Parser
+from Rule import Token, Rule
+from simple_tokenizer import Simple_Tokenizer
+
+# Set once per worker process by _init_worker, so the grammar is sent to each worker only once, and the worker's
+# parser reused for every sentence it parses
+_worker_parser: Optional[Parser] = None
+_worker_lexer: Optional[Grammar_Lexer] = None
+
+
+class Parse_Result:
+    """
+    The outcome of parsing one sentence of a batch
+
+    Attributes:
+        index       The position of the sentence in the batch
+        sentence    The sentence parsed
+        tree        Its first parse tree in bracket notation, None if it has no parse
+        error       Why it failed to parse, None if it parsed
+    """
+
+    index: int
+    sentence: str
+    tree: Optional[str]
+    error: Optional[str]
+
+    def __init__(self, index: int, sentence: str, tree: Optional[str]=None, error: Optional[str]=None) -> None:
+        self.index = index
+        self.sentence = sentence
+        self.tree = tree
+        self.error = error
+
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    def to_json(self) -> str:
+        return json.dumps({'index': self.index, 'sentence': self.sentence, 'complete': self.succeeded(),
+                           'tree': self.tree, 'error': self.error}, ensure_ascii=False)
+
+    def __str__(self) -> str:
+        return self.tree if self.tree is not None else f'{self.index}: {self.error}'
+
+
+def parse_sentence(grammar: CompiledGrammar, start_symbol: Token, index: int, sentence: str,
+                   lex: bool=False, **options: bool) -> Parse_Result:
+    """
+    Parses one whitespace separated sentence, or with lex set one split by a Grammar_Lexer, catching any failure into
+    the result rather than raising it
+    """
+    parser = Parser(grammar, start_symbol, **options)
+    return _parse_with(parser, Grammar_Lexer(parser.grammar) if lex else None, index, sentence)
+
+
+def _parse_with(parser: Parser, lexer: Optional[Grammar_Lexer], index: int, sentence: str) -> Parse_Result:
+    try:
+        tokens = lexer.tokenize(sentence) if lexer else Simple_Tokenizer(sentence).tokenize()
+        error = parser.parse(tokens)
+        tree = parser.parse_tree()
+        if tree is None:
+            return Parse_Result(index, sentence, error=str(error))
+        return Parse_Result(index, sentence, tree=tree.bracketed())
+    except Exception as e:
+        # One bad sentence must not lose the rest of the batch
+        return Parse_Result(index, sentence, error=f'{type(e).__name__}: {e}')
+
+
+def _init_worker(grammar: CompiledGrammar, start_symbol: Token, lex: bool, options: Dict[str, Any]) -> None:
+    global _worker_parser, _worker_lexer
+    _worker_parser = Parser(grammar, start_symbol, **options)
+    _worker_lexer = Grammar_Lexer(grammar) if lex else None
+
+
+def _parse_in_worker(chunk: List[Tuple[int, str]]) -> List[Parse_Result]:
+    if _worker_parser is None:
+        raise ValueError('Batch worker used before it was initialized')
+    return [_parse_with(_worker_parser, _worker_lexer, index, sentence) for index, sentence in chunk]
+
+
+def iter_parse(sentences: Iterable[str], grammar: Union[CompiledGrammar, Mapping[Token, List[Rule]]],
+               start_symbol: Token=Token('S'), workers: Optional[int]=None, chunksize: int=64, lex: bool=False,
+               **options: bool) -> Iterator[Parse_Result]:
+    """
+    Parses the sentences across a pool of worker processes, yielding their results in input order as they are ready.
+
+    Each worker receives the compiled grammar once, when it starts, and the sentences in chunks of chunksize, so
+    little more than the sentences and their trees cross between processes. Only a couple of chunks per worker are
+    read ahead of the results yielded, so sentences can be streamed from a file of any size. workers defaults to the
+    number of CPUs, and with a single worker the sentences are parsed in this process. Each process parses all its
+    sentences with one Parser, built with options, ex. leo=True. Sentences are split on whitespace, or with lex set by
+    a Grammar_Lexer of the grammar.
+    """
+    compiled = grammar if isinstance(grammar, CompiledGrammar) else CompiledGrammar(grammar)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        parser = Parser(compiled, start_symbol, **options)
+        lexer = Grammar_Lexer(compiled) if lex else None
+        for index, sentence in enumerate(sentences):
+            yield _parse_with(parser, lexer, index, sentence)
+        return
+    items = enumerate(sentences)
+    # Pool.imap would read every sentence into its task queue up front, so chunks are submitted as results are used
+    pending: Deque['AsyncResult[List[Parse_Result]]'] = deque()
+    with Pool(workers, initializer=_init_worker, initargs=(compiled, start_symbol, lex, options)) as pool:
+        while True:
+            chunk = list(islice(items, chunksize))
+            if chunk:
+                pending.append(pool.apply_async(_parse_in_worker, (chunk,)))
+            if not pending:
+                return
+            if not chunk or len(pending) > workers * 2:
+                yield from pending.popleft().get()
+
+
+def parse_many(sentences: Iterable[str], grammar: Union[CompiledGrammar, Mapping[Token, List[Rule]]],
+               start_symbol: Token=Token('S'), workers: Optional[int]=None, chunksize: Optional[int]=None,
+               lex: bool=False, **options: bool) -> List[Parse_Result]:
+    """
+    Parses all the sentences as iter_parse does, returning their results in input order. By default the sentences
+    are split into about four chunks per worker, which keeps workers busy without sending sentences one at a time.
+    """
+    sentences = list(sentences)
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, -(-len(sentences) // (workers * 4)))
+    return list(iter_parse(sentences, grammar, start_symbol, workers, chunksize, lex, **options))
+
+
+def write_json_lines(results: Iterable[Parse_Result], output: TextIO, flush_every: int=1000) -> None:
+    """
+    Writes each result to the output as one line of JSON as soon as it is ready, flushing every flush_every results
+    """
+    lines: List[str] = []
+    for result in results:
+        lines.append(result.to_json() + '\n')
+        if len(lines) >= flush_every:
+            output.writelines(lines)
+            output.flush()
+            lines.clear()
+    output.writelines(lines)
+    output.flush()
@@ -0,0 +1,220 @@
+from argparse import ArgumentParser
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import EBNF_Grammar
+from EBNF_Tokenizer import EBNF_Tokenizer
+from Grammar import CompiledGrammar
+from Grammar_Cache import compile_ebnf
+from Parser import Parser
+from Rule import Token, Rule
+from simple_tokenizer import Simple_Tokenizer
+
+# Results as {workload: {size: {measure: value}}}, the shape of baseline files
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+class Workload:
+    """
+    A family of inputs of growing size for one grammar, stressing one behaviour of the parser
+
+    Attributes:
+        name            The name results and baselines are keyed by
+        description     What the workload stresses
+        start_symbol    The start symbol of the grammar
+        make_input      Returns the input tokens of a given size
+        sizes           The input sizes measured
+        options         Keyword arguments for Parser, ex. leo=True
+    """
+
+    name: str
+    description: str
+    start_symbol: Token
+    make_input: Callable[[int], List[Token]]
+    sizes: List[int]
+    options: Dict[str, bool]
+    _make_grammar: Callable[[], CompiledGrammar]
+    _grammar: Optional[CompiledGrammar]
+
+    def __init__(self, name: str, description: str, make_grammar: Callable[[], CompiledGrammar], start_symbol: Token,
+                 make_input: Callable[[int], List[Token]], sizes: List[int], **options: bool) -> None:
+        self.name = name
+        self.description = description
+        self._make_grammar = make_grammar
+        self._grammar = None
+        self.start_symbol = start_symbol
+        self.make_input = make_input
+        self.sizes = sizes
+        self.options = options
+
+    def load_grammar(self) -> CompiledGrammar:
+        """
+        Returns the compiled grammar, building it with make_grammar the first time
+        """
+        if self._grammar is None:
+            self._grammar = self._make_grammar()
+        return self._grammar
+
+    def parse(self, tokens: List[Token]) -> Parser:
+        parser = Parser(self.load_grammar(), self.start_symbol, tokens, **self.options)
+        parser.parse()
+        if not parser.is_complete():
+            raise ValueError(f'{self.name} input of {len(tokens)} tokens does not parse: {parser.error}')
+        return parser
+
+    def measure(self, size: int, repeat: int) -> Dict[str, float]:
+        """
+        Returns the best time of repeat parses of the input of the given size, in seconds, the number of chart items
+        created and the peak memory allocated while parsing, in bytes, which is measured in a separate run as tracing
+        allocations slows parsing down
+        """
+        tokens = self.make_input(size)
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parser = self.parse(tokens)
+            best = min(best, time.perf_counter() - start)
+        items = sum(len(row) for row in parser.chart)
+        del parser
+        tracemalloc.start()
+        try:
+            self.parse(tokens)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {'time': best, 'items': items, 'memory': peak}
+
+
+def _words(text: str) -> List[Token]:
+    return Simple_Tokenizer(text).tokenize()
+
+
+def _lexicon_grammar(size: int) -> CompiledGrammar:
+    # Built directly, as the EBNF bootstrap of one rule with thousands of alternatives is itself a benchmark
+    sentence, word = Token('S'), Token('Word')
+    return CompiledGrammar({
+        sentence: [Rule(sentence, [sentence, word]), Rule(sentence, [word])],
+        word: [Rule(word, [Token('_TERMINAL', f'w{index}')]) for index in range(size)],
+    })
+
+
+def _lexicon_input(size: int) -> List[Token]:
+    words = random.Random(size)
+    return _words(' '.join(f'w{words.randrange(LEXICON_SIZE)}' for _ in range(size)))
+
+
+def _ebnf_rules(size: int) -> str:
+    rules = [f'R{index} = R{index + 1}, "a{index}" | "b{index}", [R{index + 1}], {{"c{index}"}};'
+             for index in range(size)]
+    return '\n'.join(rules + [f'R{size} = "end";']) + '\n'
+
+
+def _pp_grammar() -> CompiledGrammar:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'microscope.ebnf')) as grammar_file:
+        return compile_ebnf(grammar_file.read())
+
+
+LEXICON_SIZE = 5000
+
+WORKLOADS: List[Workload] = [
+    Workload('ambiguous', 'S = S, S | "a" - Catalan many parses, packed into a polynomial chart',
+             lambda: compile_ebnf('S = S, S | "a";'), Token('S'), lambda size: _words('a ' * size), [8, 16, 32],
+             packed=True),
+    Workload('left_recursive', 'L = L, "x" | "x" - a linear chart', lambda: compile_ebnf('L = L, "x" | "x";'),
+             Token('L'), lambda size: _words('x ' * size), [250, 500, 1000]),
+    Workload('right_recursive', 'R = "x", R | "x" - linear only through Leo items',
+             lambda: compile_ebnf('R = "x", R | "x";'), Token('R'), lambda size: _words('x ' * size),
+             [250, 500, 1000], leo=True),
+    Workload('pp_attachment', 'microscope.ebnf with a chain of trailing PPs, packed', _pp_grammar, Token('S'),
+             lambda size: _words('Jen saw the man' + ' with the microscope' * size), [4, 8, 16], packed=True),
+    Workload('large_lexicon', f'a left recursive list over a lexicon of {LEXICON_SIZE} words',
+             lambda: _lexicon_grammar(LEXICON_SIZE), Token('S'), _lexicon_input, [100, 200, 400]),
+    Workload('ebnf_rules', 'the EBNF grammar parsing generated grammars of hundreds of rules',
+             lambda: CompiledGrammar(EBNF_Grammar.grammar), EBNF_Grammar.start_symbol,
+             lambda size: EBNF_Tokenizer(io.StringIO(_ebnf_rules(size))).tokenize(), [100, 200, 400], leo=True),
+]
+
+
+def run(workloads: List[Workload], repeat: int, quick: bool=False) -> Results:
+    results: Results = {}
+    for workload in workloads:
+        # Compiled before any parse is timed
+        start = time.perf_counter()
+        workload.load_grammar()
+        print(f'{workload.name}: {workload.description} - grammar built in '
+              f'{(time.perf_counter() - start) * 1000:.1f} ms')
+        results[workload.name] = {}
+        previous: Optional[Dict[str, float]] = None
+        previous_size = 0
+        for size in workload.sizes[:2] if quick else workload.sizes:
+            measures = workload.measure(size, repeat)
+            results[workload.name][str(size)] = measures
+            # The exponent k of time ~ n^k between successive sizes shows how the workload scales
+            growth = ''
+            if previous and previous['time'] > 0:
+                exponent = math.log(measures['time'] / previous['time']) / math.log(size / previous_size)
+                growth = f'n^{exponent:.2f}'
+            print(f'  n={size:<6} {measures["time"] * 1000:10.1f} ms {int(measures["items"]):10} items '
+                  f'{measures["memory"] / 1024:10.0f} KiB  {growth}')
+            previous, previous_size = measures, size
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    """
+    Returns a description of each measure that regressed against the baseline - time or memory more than threshold
+    times the baseline's, or any more chart items
+    """
+    regressions = []
+    for name, sizes in results.items():
+        for size, measures in sizes.items():
+            base = baseline.get(name, {}).get(size)
+            if base is None:
+                continue
+            for measure in ('time', 'memory'):
+                if measures[measure] > base[measure] * threshold:
+                    regressions.append(f'{name} n={size}: {measure} {measures[measure]:.4g} is over {threshold} '
+                                       f'times the baseline {base[measure]:.4g}')
+            if measures['items'] > base['items']:
+                regressions.append(f'{name} n={size}: {int(measures["items"])} items, '
+                                   f'up from {int(base["items"])}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the parser on synthetic workloads of growing size')
+    parser.add_argument('-w', '--workload', action='append', choices=[workload.name for workload in WORKLOADS],
+                        help='A workload to run, default all of them - may be given more than once')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Parses per size, the best time is kept')
+    parser.add_argument('--quick', action='store_true', help='Only run the two smallest sizes of each workload')
+    parser.add_argument('--baseline', help='A results file to compare against, failing if any measure regressed')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='How many times its baseline time or memory a measure may take, default 1.5')
+    parser.add_argument('--save', help='Write the results to this file, to serve as a baseline')
+
+    args = parser.parse_args()
+
+    # Building grammars from EBNF visits a parse tree recursively, and it nests one level per alternative and rule
+    sys.setrecursionlimit(20000)
+    selected = [workload for workload in WORKLOADS if not args.workload or workload.name in args.workload]
+    results = run(selected, args.repeat, args.quick)
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline: Dict[str, Any] = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
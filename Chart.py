@@ -0,0 +1,293 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from Grammar import CompiledGrammar
+from Rule import Token, Rule
+
+
+class Chart_Row:
+    """
+    What the parser needs of a row of the Earley chart, whichever way the row stores its rules
+
+    Attributes:
+        predicted   The ids of the symbols whose productions have already been predicted into this row
+        transitive  Leo's transitive items - maps a symbol id to the index of the topmost rule its completion from this
+                    row deterministically completes, or None when there is no such rule
+
+    Rules are stored by Row and Compact_Row, which implement the methods raising NotImplementedError here. Rules
+    compare as Rule.__eq__ does whichever row they are in, so both give the same chart.
+    """
+
+    predicted: Set[int]
+    transitive: Dict[int, Optional[Tuple[int, int]]]
+
+    def __init__(self) -> None:
+        self.predicted = set()
+        self.transitive = {}
+
+    def clear(self) -> None:
+        """
+        Empties the row in place, so a parser can reuse it rather than allocate a new one
+        """
+        self.predicted.clear()
+        self.transitive.clear()
+
+    def append(self, rule: Rule, next_symbol: Optional[int]=None) -> None:
+        """
+        Adds the rule at the end of the row, waiting on next_symbol if given
+        """
+        raise NotImplementedError
+
+    def position(self, rule: Rule) -> int:
+        """
+        Returns the column the first rule of the row equal to the given one was inserted at
+        """
+        raise NotImplementedError
+
+    def add_link(self, column: int, previous_rule: Optional[Tuple[int, int]],
+                 updated_rule: Optional[Tuple[int, int]]) -> None:
+        """
+        Records another derivation of the rule at the column, merged into it rather than inserted as a duplicate - see
+        Parser.packed
+        """
+        raise NotImplementedError
+
+    def links_of(self, column: int) -> List[Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]]:
+        """
+        Returns the (previous_rule, updated_rule) pairs recorded by add_link for the rule at the column
+        """
+        raise NotImplementedError
+
+    def waiting_on(self, symbol: int) -> Sequence[Rule]:
+        """
+        Returns the rules of the row with the symbol after their dot, in insertion order
+        """
+        raise NotImplementedError
+
+    def first_waiting(self, symbol: int) -> Optional[int]:
+        """
+        Returns the column of the first rule of this row waiting on the symbol, None if no rule is
+        """
+        raise NotImplementedError
+
+    def waiting_symbols(self) -> Iterable[int]:
+        raise NotImplementedError
+
+    def __contains__(self, rule: object) -> bool:
+        raise NotImplementedError
+
+    def __getitem__(self, column: int) -> Rule:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Rule]:
+        # Rules appended during iteration must be visited, as the parser relies on
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class Row(Chart_Row):
+    """
+    A row of the Earley chart
+
+    Attributes:
+        items       The rules of the row, in insertion order - a rule's column is its position in this list
+        positions   A hash index of the same rules, mapping each rule to the column it was first inserted at
+        waiting     Maps a symbol id to the rules of this row with that symbol after their dot, in insertion order
+        links       Extra derivations of rules, by column - pairs of previous and updated rule indices
+
+    Rules are hashed on their lhs, rhs, start, current and dot indices, the same identity Rule.__eq__ uses, so checking
+    whether an equivalent rule is already in the row does not scan the row.
+    """
+
+    items: List[Rule]
+    positions: Dict[Rule, int]
+    waiting: Dict[int, List[Rule]]
+    links: Dict[int, List[Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]]]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.items = []
+        self.positions = {}
+        self.waiting = {}
+        self.links = {}
+
+    def clear(self) -> None:
+        super().clear()
+        self.items.clear()
+        self.positions.clear()
+        self.waiting.clear()
+        self.links.clear()
+
+    def append(self, rule: Rule, next_symbol: Optional[int]=None) -> None:
+        self.positions.setdefault(rule, len(self.items))
+        self.items.append(rule)
+        if next_symbol is not None:
+            self.waiting.setdefault(next_symbol, []).append(rule)
+
+    def position(self, rule: Rule) -> int:
+        return self.positions[rule]
+
+    def add_link(self, column: int, previous_rule: Optional[Tuple[int, int]],
+                 updated_rule: Optional[Tuple[int, int]]) -> None:
+        self.links.setdefault(column, []).append((previous_rule, updated_rule))
+
+    def links_of(self, column: int) -> List[Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]]:
+        return self.links.get(column, [])
+
+    def waiting_on(self, symbol: int) -> Sequence[Rule]:
+        return self.waiting.get(symbol, ())
+
+    def first_waiting(self, symbol: int) -> Optional[int]:
+        rules = self.waiting.get(symbol)
+        if not rules or rules[0].index is None:
+            return None
+        return rules[0].index[1]
+
+    def waiting_symbols(self) -> Iterable[int]:
+        return self.waiting.keys()
+
+    def __contains__(self, rule: object) -> bool:
+        return rule in self.positions
+
+    def __getitem__(self, column: int) -> Rule:
+        return self.items[column]
+
+    def __iter__(self) -> Iterator[Rule]:
+        # Iterating the list itself lets rules appended during iteration be visited
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+# The number of ints Compact_Row stores per rule
+_FIELDS = 7
+
+
+class Compact_Row(Chart_Row):
+    """
+    A row of the Earley chart storing each rule as ints in a single array, rather than as a Rule object
+
+    Attributes:
+        grammar         The compiled grammar the rules' codes refer to
+        tokens          The input tokens, which scanned rules take their right hand side from
+        row_index       The index of this row in the chart, the current index of all its rules
+        fields          Seven ints per rule, one rule after another: the production id, or for scanned rules the number
+                        of productions plus the id of their lhs symbol, the dot index, the start index, and the row and
+                        column of the previous and of the updated rule, -1 for None
+        keys            Maps each rule's origin, dot and production, packed into a single int, to its first column -
+                        productions with the same lhs and rhs share a key, as their rules compare equal
+        waiting_columns Maps a symbol id to the columns of the rules with that symbol after their dot
+        link_fields     Extra derivations of rules, by column - four ints per derivation, the row and column of its
+                        previous and of its updated rule, -1 for None
+
+    Rules read from the row are Rule objects decoded from the array on each access. They compare, print and build
+    trees like the rules of a Row, but changing them does not change the row.
+    """
+
+    grammar: CompiledGrammar
+    tokens: List[Token]
+    row_index: int
+    fields: 'array[int]'
+    keys: Dict[int, int]
+    waiting_columns: Dict[int, 'array[int]']
+    link_fields: Dict[int, 'array[int]']
+
+    def __init__(self, grammar: CompiledGrammar, tokens: List[Token], row_index: int) -> None:
+        super().__init__()
+        self.grammar = grammar
+        self.tokens = tokens
+        self.row_index = row_index
+        self.fields = array('i')
+        self.keys = {}
+        self.waiting_columns = {}
+        self.link_fields = {}
+
+    def clear(self) -> None:
+        super().clear()
+        del self.fields[:]
+        self.keys.clear()
+        self.waiting_columns.clear()
+        self.link_fields.clear()
+
+    def __code(self, rule: Rule) -> int:
+        if rule.production is None:
+            return len(self.grammar.rules) + self.grammar.symbol_ids[rule.lhs]
+        return rule.production
+
+    def __key(self, rule: Rule) -> int:
+        # Rules of one row share their current index, and a scanned rule's rhs is fixed by its start index
+        code = self.grammar.first_equal[rule.production] if rule.production is not None else self.__code(rule)
+        code_count = len(self.grammar.rules) + len(self.grammar.symbols)
+        return (rule.start_index * code_count + code) * (self.grammar.longest_rhs + 1) + rule.dot_index
+
+    def append(self, rule: Rule, next_symbol: Optional[int]=None) -> None:
+        column = len(self.fields) // _FIELDS
+        previous_row, previous_column = rule.previous_rule or (-1, -1)
+        updated_row, updated_column = rule.updated_rule or (-1, -1)
+        self.fields.extend((self.__code(rule), rule.dot_index, rule.start_index, previous_row, previous_column,
+                            updated_row, updated_column))
+        self.keys.setdefault(self.__key(rule), column)
+        if next_symbol is not None:
+            self.waiting_columns.setdefault(next_symbol, array('i')).append(column)
+
+    def position(self, rule: Rule) -> int:
+        return self.keys[self.__key(rule)]
+
+    def add_link(self, column: int, previous_rule: Optional[Tuple[int, int]],
+                 updated_rule: Optional[Tuple[int, int]]) -> None:
+        self.link_fields.setdefault(column, array('i')).extend((*(previous_rule or (-1, -1)),
+                                                                 *(updated_rule or (-1, -1))))
+
+    def links_of(self, column: int) -> List[Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]]:
+        fields = self.link_fields.get(column, ())
+        return [((fields[offset], fields[offset + 1]) if fields[offset] >= 0 else None,
+                 (fields[offset + 2], fields[offset + 3]) if fields[offset + 2] >= 0 else None)
+                for offset in range(0, len(fields), 4)]
+
+    def waiting_on(self, symbol: int) -> Sequence[Rule]:
+        return [self[column] for column in self.waiting_columns.get(symbol, ())]
+
+    def first_waiting(self, symbol: int) -> Optional[int]:
+        columns = self.waiting_columns.get(symbol)
+        return columns[0] if columns else None
+
+    def waiting_symbols(self) -> Iterable[int]:
+        return self.waiting_columns.keys()
+
+    def __contains__(self, rule: object) -> bool:
+        return isinstance(rule, Rule) and rule.current_index == self.row_index and self.__key(rule) in self.keys
+
+    def __getitem__(self, column: int) -> Rule:
+        if column < 0:
+            column += len(self)
+        offset = column * _FIELDS
+        if not 0 <= offset < len(self.fields):
+            raise IndexError('Compact_Row index out of range')
+        fields = self.fields
+        code, start_index, previous_row, updated_row = \
+            fields[offset], fields[offset + 2], fields[offset + 3], fields[offset + 5]
+        production: Optional[int] = code
+        if code < len(self.grammar.rules):
+            template = self.grammar.rules[code]
+            lhs, rhs = template.lhs, template.rhs
+        else:
+            production = None
+            lhs, rhs = self.grammar.symbols[code - len(self.grammar.rules)], (self.tokens[start_index],)
+        return Rule(lhs, rhs, start_index, self.row_index, fields[offset + 1], (self.row_index, column),
+                    previous_rule=(previous_row, fields[offset + 4]) if previous_row >= 0 else None,
+                    updated_rule=(updated_row, fields[offset + 6]) if updated_row >= 0 else None,
+                    production=production)
+
+    def __iter__(self) -> Iterator[Rule]:
+        # Checking the length on every step lets rules appended during iteration be visited, as with Row
+        column = 0
+        fields = self.fields
+        while column * _FIELDS < len(fields):
+            yield self[column]
+            column += 1
+
+    def __len__(self) -> int:
+        return len(self.fields) // _FIELDS
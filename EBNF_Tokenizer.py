@@ -1,102 +1,123 @@
+import mmap
+import os
 import re
-from typing import List, Optional, TextIO
+from typing import Iterator, List, Optional, Pattern, TextIO, Union
 import sys
-from Rule import Token
+from Rule import Token, Located_Token
 
+# A token and the whitespace before it. There is one alternative per kind of token, tried in order, so anything else
+# starts an identifier, and a quote only matches open_quote when it is never closed.
+_TOKEN_PATTERN = r'''
+    {space}*
+  (?:
+    (?P<symbol>[\[\]{{}}()<>=,.;|])
+  | (?P<terminal>'[^']*'|"[^"]*")
+  | (?P<open_quote>['"])
+  | (?P<identifier>{start}[A-Za-z0-9_]*)
+  )
+'''
+_TEXT_PATTERN = re.compile(_TOKEN_PATTERN.format(space=r'\s', start=r'\S'), re.VERBOSE)
+
+
+def _utf8(char: str) -> str:
+    return ''.join(f'\\x{byte:02x}' for byte in char.encode('utf-8'))
 
-class Char_Reader:
-    """
-    A simple text reader that returns one character at a time from a file
-    """
 
-    text: str
-    line_number: int
-    char_index: int
-    horiz_position: int
-
-    def __init__(self, source: TextIO) -> None:
-        self.text = source.read()
-        self.char_index = 0
-        self.line_number = 0
-        self.horiz_position = 0
-
-    def peek(self) -> str:
-        try:
-            return self.text[self.char_index]
-        except IndexError:
-            return ''
-
-    def read(self) -> str:
-        try:
-            char = self.text[self.char_index]
-        except IndexError:
-            return ''
-        self.horiz_position += 1
-        if char == '\n':
-            self.line_number += 1
-            self.horiz_position = 0
-        self.char_index += 1
-        return char
+# Files read through a memory map are scanned as UTF-8 bytes, where a character may take several bytes, and where \s
+# only matches ASCII whitespace - the other characters \s matches in text are spelled out
+_BYTES_SPACE = '(?:' + '|'.join(_utf8(char) for char in map(chr, range(0x3001)) if char.isspace()) + ')'
+_BYTES_PATTERN = re.compile(
+    _TOKEN_PATTERN.format(space=_BYTES_SPACE, start=r'(?:[\xc0-\xff][\x80-\xbf]+|\S)').encode('latin-1'), re.VERBOSE
+)
+
+Source = Union[str, bytes, mmap.mmap]
+
 
 class EBNF_Tokenizer:
     """
     A tokenizer for EBNF_Grammar.py. It distinguishes identifiers, terminals, and symbols.
-    """
-    reader: Char_Reader
-    quotes: List[str]
 
-    def __init__(self, source: TextIO):
-        self.reader = Char_Reader(source)
-        symbols = ["[" , "]" , "{" , "}" , "(" , ")" , "<" , ">", "=" , "," , "." , "," , ";", "=", "|"]
-        self.symbols = {symbol : Token("_TERMINAL", value=symbol) for symbol in symbols}
-        self.quotes = []
+    Attributes:
+        text        The text being tokenized - a string, or the bytes of a memory mapped file, see tokenize_file
 
+    The text is scanned in a single pass of one compiled pattern. Tokens are Located_Tokens, carrying the line and
+    column they start at.
+    """
+    text: Source
+    _tokens: Optional[Iterator[Token]]
+
+    def __init__(self, source: Union[TextIO, Source]):
+        self.text = source if isinstance(source, (str, bytes, mmap.mmap)) else source.read()
+        self._tokens = None
+
+    def iter_tokens(self) -> Iterator[Token]:
+        """
+        Yields the tokens of the text in order, raising a ValueError on a quote that is never closed
+        """
+        text = self.text
+        is_text = isinstance(text, str)
+        pattern: Pattern = _TEXT_PATTERN if is_text else _BYTES_PATTERN
+        newline = '\n' if is_text else b'\n'
+        line, line_start = 1, 0
+        # Columns of bytes are counted in characters from the last token on the same line, so long lines are decoded
+        # once rather than from their start for every token
+        counted, counted_column = 0, 1
+        for match in pattern.finditer(text):
+            kind = match.lastgroup or ''
+            start = match.start(kind)
+            # Only whitespace and quoted terminals can span lines
+            if start != match.start():
+                space = match.group()[:start - match.start()]
+                newlines = space.count(newline)
+                if newlines:
+                    line += newlines
+                    line_start = match.start() + space.rfind(newline) + 1
+            matched = match.group(kind)
+            if is_text:
+                column = start - line_start + 1
+                value = matched
+            else:
+                if counted < line_start:
+                    counted, counted_column = line_start, 1
+                column = counted_column + len(text[counted:start].decode('utf-8', 'replace'))
+                counted, counted_column = start, column
+                value = matched.decode('utf-8')
+            if kind == 'symbol':
+                yield Located_Token('_TERMINAL', value, line, column)
+            elif kind == 'terminal':
+                # strip the quotes from our terminals
+                yield Located_Token('terminal', value[1:-1], line, column)
+                newlines = matched.count(newline)
+                if newlines:
+                    line += newlines
+                    line_start = start + matched.rfind(newline) + 1
+            elif kind == 'open_quote':
+                raise ValueError(f'Error: File ended on an open quote, opened at line {line}, column {column}')
+            else:
+                yield Located_Token('identifier', value, line, column)
 
     def next_token(self) -> Optional[Token]:
-        char = self.reader.read()
-        if not char:
-            return None
-        while re.match(r'\s', char):
-            char = self.reader.read()
-            if not char:
-                return None
-        if char in self.symbols:
-            return self.symbols[char]
-        tok = char
-        if re.match(r'[\'\"]', char):
-            quote = char
-            char = self.reader.read()
-            while char != quote:
-                tok += char
-                char = self.reader.read()
-                if not char:
-                    raise ValueError("Error: File ended on an open quote")
-            tok += char
-            # strip the quotes from our terminals
-            return Token("terminal", value=tok[1:-1])
-        while re.match(r'[A-Za-z0-9_]', self.reader.peek()):
-            char = self.reader.read()
-            tok += char
-            if not char:
-                raise ValueError("Error: File ended while processing an identifier")
-        return Token("identifier", value=tok)
+        if self._tokens is None:
+            self._tokens = self.iter_tokens()
+        return next(self._tokens, None)
 
     def tokenize(self) -> List[Token]:
-        tokens = []
-        token = self.next_token()
-        while not token is None:
-            tokens.append(token)
-            token = self.next_token()
-        return tokens
-
-
+        return list(self.iter_tokens())
 
 
+def tokenize_file(path: str) -> List[Token]:
+    """
+    Tokenizes a grammar file through a memory map, so its text is never read into one string
+    """
+    with open(path, 'rb') as file:
+        # An empty file cannot be mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return EBNF_Tokenizer(mapped).tokenize()
 
 
 if __name__ == '__main__':
     with open(sys.argv[2]) as f:
         test = EBNF_Tokenizer(f)
         print(*test.tokenize(), sep='\n')
-
-
@@ -1,11 +1,20 @@
 from typing import Callable, Dict, List
 
 from Tree import Node
-from Rule import Rule, Token
+from Rule import Located_Token, Rule, Token
+
+def location(node: Node[Token]) -> str:
+    """
+    Returns where in the grammar's text the node starts, as ' at line l, column c', or '' if its tokens were not read
+    from a text
+    """
+    while node.children:
+        node = node.children[0]
+    return f" at {node.value.location()}" if isinstance(node.value, Located_Token) else ""
 
 def expect(node: Node[Token], char: str) -> None:
     if not node.value.value == char:
-        raise ValueError(f"Unexpected {node.value}, expected a {char}")
+        raise ValueError(f"Unexpected {node.value}{location(node)}, expected a {char}")
 
 class EBNF_Visitor:
     """
@@ -44,7 +53,7 @@ class EBNF_Visitor:
             raise ValueError("visit_rules returned no rule")
         rule, *_ = rules
         if rule.lhs in self.grammar:
-            raise ValueError(f"Repeated rules are not yet allowed with rhs {rule.rhs}")
+            raise ValueError(f"Repeated rules are not yet allowed with rhs {rule.rhs}{location(rule_node)}")
         self.grammar[rule.lhs] = rules
 
 
@@ -188,8 +197,10 @@ class EBNF_Visitor:
         repeat_token = Token(repeat_string)
         #  B_RPT -> B
         # rhs_rpt: B_RPT -> B, B_RPT
-        rhs_rpt = [rhs + [repeat_token] for rhs in repeat_rhs]
-        rhs_rpt.extend(repeat_rhs)
+        # Empty alternatives of B are left out, the empty case is already covered by A -> C
+        rhs_rpt = [rhs + [repeat_token] for rhs in repeat_rhs if rhs]
+        rhs_rpt.extend(rhs for rhs in repeat_rhs if rhs)
+        self.grammar[repeat_token] = [Rule(repeat_token, rhs) for rhs in rhs_rpt]
         # A -> C  (the expression in brackets is empty)
         # A -> B_RPT, C (where B_RPT represents B one or more times)
         return [[], [repeat_token]]
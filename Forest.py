@@ -0,0 +1,114 @@
+from typing import List, Optional, Set, Tuple, Union
+
+from Rule import Token, Rule
+
+
+class Symbol_Node:
+    """
+    A node of a shared packed parse forest, standing for every derivation of a symbol over a span of the input
+
+    Attributes:
+        symbol          The symbol derived, or the input token itself for leaves
+        start_index     The index of the first token of the span
+        end_index       The index just past the last token of the span
+        alternatives    One packed node per distinct derivation - empty for input tokens and scanned terminals
+
+    Each (symbol, start, end) appears once in a forest, so derivations sharing a constituent share its node. Forests
+    are binarised - a packed node has at most two children, see Packed_Node - so they stay cubic in the input length
+    however ambiguous it is.
+    """
+
+    symbol: Token
+    start_index: int
+    end_index: int
+    alternatives: List['Packed_Node']
+    _seen: Set[Tuple[Optional[Tuple[Token, ...]], Tuple[int, ...]]]
+
+    def __init__(self, symbol: Token, start_index: int, end_index: int) -> None:
+        self.symbol = symbol
+        self.start_index = start_index
+        self.end_index = end_index
+        self.alternatives = []
+        self._seen = set()
+
+    def add_alternative(self, rule: Optional[Rule], children: Tuple['Forest_Node', ...]) -> None:
+        # Keyed on the rhs rather than the rule, so the same derivation reached through a collapsed unit rule is merged
+        key = (rule.rhs if rule else None, tuple(id(child) for child in children))
+        if key not in self._seen:
+            self._seen.add(key)
+            self.alternatives.append(Packed_Node(rule, children))
+
+    def is_ambiguous(self) -> bool:
+        return len(self.alternatives) > 1
+
+    def __str__(self) -> str:
+        return f'{self.symbol} [{self.start_index:2}, {self.end_index:2}]'
+
+
+class Intermediate_Node:
+    """
+    A node of a shared packed parse forest, standing for every derivation of the start of a rule's right hand side
+    over a span of the input - the part of the rule an Earley item has recognised
+
+    Attributes:
+        rule            The grammar rule
+        dot_index       How many symbols of the rule's right hand side the node derives, at least two
+        start_index     The index of the first token of the span
+        end_index       The index just past the last token of the span
+        alternatives    One packed node per distinct derivation
+    """
+
+    rule: Rule
+    dot_index: int
+    start_index: int
+    end_index: int
+    alternatives: List['Packed_Node']
+    _seen: Set[Tuple[int, ...]]
+
+    def __init__(self, rule: Rule, dot_index: int, start_index: int, end_index: int) -> None:
+        self.rule = rule
+        self.dot_index = dot_index
+        self.start_index = start_index
+        self.end_index = end_index
+        self.alternatives = []
+        self._seen = set()
+
+    def add_alternative(self, children: Tuple['Forest_Node', ...]) -> None:
+        key = tuple(id(child) for child in children)
+        if key not in self._seen:
+            self._seen.add(key)
+            self.alternatives.append(Packed_Node(self.rule, children))
+
+    def is_ambiguous(self) -> bool:
+        return len(self.alternatives) > 1
+
+    def __str__(self) -> str:
+        rhs_str = ' '.join(str(tok) for tok in self.rule.rhs[:self.dot_index])
+        return f'{self.rule.lhs} → {rhs_str}• [{self.start_index:2}, {self.end_index:2}]'
+
+
+class Packed_Node:
+    """
+    One derivation of a symbol or intermediate node
+
+    Attributes:
+        rule        The grammar rule applied, or None when a preterminal matches an input token or a nullable symbol
+                    derives nothing
+        children    The nodes the rule's right hand side derives, binarised - nothing for an empty right hand side, the
+                    symbol node of a single symbol, and otherwise two nodes: the one deriving every symbol but the last,
+                    a symbol node if that is a single symbol and an intermediate node if not, and the symbol node of
+                    the last
+    """
+
+    rule: Optional[Rule]
+    children: Tuple['Forest_Node', ...]
+
+    def __init__(self, rule: Optional[Rule], children: Tuple['Forest_Node', ...]) -> None:
+        self.rule = rule
+        self.children = children
+
+    def __str__(self) -> str:
+        return ' '.join(str(child) for child in self.children)
+
+
+Forest_Node = Union[Symbol_Node, Intermediate_Node]
@@ -0,0 +1,224 @@
+from typing import Dict, FrozenSet, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from Rule import Token, Rule
+
+
+class CompiledGrammar:
+    """
+    A grammar compiled once from a dictionary of rules, such as the ones produced by EBNF_Visitor.generate_grammar or
+    simple_sentence.grammar. It holds no parse state, so one instance can be shared by any number of parsers.
+
+    Attributes:
+        symbols         Every symbol of the grammar, indexed by its id
+        symbol_ids      Maps each symbol to its id
+        rules           The rules of the grammar, indexed by production id
+        lhs             The lhs symbol id of each production
+        rhs             The rhs symbol ids of each production
+        longest_rhs     The length of the longest rhs
+        first_equal     For each production, the first production with the same lhs and rhs - itself unless the grammar
+                        repeats an alternative, whose rules then compare equal though their ids differ
+        rules_by_lhs    The production ids of each symbol, indexed by symbol id
+        terminal        Whether each symbol is a terminal, ie. has no rules of its own
+        preterminal     Whether each symbol is a nonterminal producing only single terminals, ex. N -> "man" | "microscope"
+        terminating     Whether each symbol is scanned rather than predicted - terminals and preterminals
+        nullable        Whether each symbol can derive the empty string
+        first           The terminals and preterminals each symbol can begin with, the symbol itself for those - the
+                        FIRST set, in terms of the symbols the parser scans
+        production_first    The terminals and preterminals each production can begin with, looking through nullable
+                            symbols
+        production_nullable Whether each production can derive the empty string
+        lexicon         The terminal values produced by the rules of each symbol, indexed by symbol id
+        terminals       The same terminal values, keyed by symbol token
+        word_index      Maps each terminal value to the preterminals producing it, the inverse of lexicon
+        prediction_closure  For each symbol, the productions predicting it adds to a row, directly or transitively
+                            through their first non nullable symbol, as (production, parent) pairs where parent is the position of
+                            the pair that caused the prediction, or -1
+        closure_symbols The symbols whose productions make up each prediction closure
+        unit_chains     For productions a Grammar_Optimizer collapsed unit rules into, the symbols collapsed, outermost
+                        first - trees show them between the production's lhs and its children. The constructor takes
+                        them as a list per symbol, parallel to its rules in grammar.
+
+    Symbols are interned in the order they are first seen, lhs first, so ids are small dense ints and every
+    table is a list indexed by them.
+    """
+
+    symbols: List[Token]
+    symbol_ids: Dict[Token, int]
+    rules: List[Rule]
+    lhs: List[int]
+    rhs: List[Tuple[int, ...]]
+    longest_rhs: int
+    first_equal: List[int]
+    rules_by_lhs: List[Tuple[int, ...]]
+    terminal: List[bool]
+    preterminal: List[bool]
+    terminating: List[bool]
+    nullable: List[bool]
+    first: List[FrozenSet[int]]
+    production_first: List[FrozenSet[int]]
+    production_nullable: List[bool]
+    lexicon: List[FrozenSet[str]]
+    terminals: Dict[Token, Set[str]]
+    word_index: Dict[str, FrozenSet[int]]
+    prediction_closure: List[Tuple[Tuple[int, int], ...]]
+    closure_symbols: List[FrozenSet[int]]
+    unit_chains: Dict[int, Tuple[Token, ...]]
+
+    def __init__(self, grammar: Mapping[Token, List[Rule]],
+                 unit_chains: Optional[Mapping[Token, Sequence[Tuple[Token, ...]]]]=None) -> None:
+        self.symbols = []
+        self.symbol_ids = {}
+        for token in grammar.keys():
+            self.intern(token)
+        self.rules = []
+        self.lhs = []
+        self.rhs = []
+        self.unit_chains = {}
+        productions: Dict[int, List[int]] = {}
+        for token, rules in grammar.items():
+            chains = unit_chains.get(token, ()) if unit_chains else ()
+            for index, rule in enumerate(rules):
+                production = len(self.rules)
+                # Collapsed symbols are only ever shown in trees, so they are not interned - they would be taken for
+                # terminals, having no rules
+                if index < len(chains) and chains[index]:
+                    self.unit_chains[production] = tuple(chains[index])
+                self.rules.append(Rule(rule.lhs, rule.rhs, production=production))
+                self.lhs.append(self.intern(rule.lhs))
+                self.rhs.append(tuple(self.intern(tok) for tok in rule.rhs))
+                productions.setdefault(self.symbol_ids[token], []).append(production)
+
+        # Scanned rules have a single rhs token
+        self.longest_rhs = max([1] + [len(rhs) for rhs in self.rhs])
+        first_productions: Dict[Tuple[Token, Tuple[Token, ...]], int] = {}
+        self.first_equal = [first_productions.setdefault((rule.lhs, rule.rhs), production)
+                            for production, rule in enumerate(self.rules)]
+        symbol_count = len(self.symbols)
+        self.rules_by_lhs = [tuple(productions.get(symbol, ())) for symbol in range(symbol_count)]
+        self.terminal = [symbol not in grammar for symbol in self.symbols]
+        # Preterminals are scanned one input token at a time, so each of their rules holds at most one terminal
+        self.preterminal = [
+            not self.terminal[symbol]
+            and all(len(self.rhs[production]) <= 1 and all(self.terminal[tok] for tok in self.rhs[production])
+                    for production in self.rules_by_lhs[symbol])
+            for symbol in range(symbol_count)
+        ]
+        self.terminating = [self.terminal[symbol] or self.preterminal[symbol] for symbol in range(symbol_count)]
+        self.nullable = self._nullable()
+        self.production_nullable = [all(self.nullable[tok] for tok in rhs) for rhs in self.rhs]
+        self.first, self.production_first = self._first()
+        self.lexicon = [
+            frozenset(self.symbols[tok].value for production in self.rules_by_lhs[symbol]
+                      for tok in self.rhs[production] if self.terminal[tok])
+            for symbol in range(symbol_count)
+        ]
+        self.terminals = {
+            self.symbols[symbol]: set(self.lexicon[symbol]) for symbol in range(symbol_count) if not self.terminal[symbol]
+        }
+        word_index: Dict[str, Set[int]] = {}
+        for symbol in range(symbol_count):
+            if self.preterminal[symbol]:
+                for word in self.lexicon[symbol]:
+                    word_index.setdefault(word, set()).add(symbol)
+        self.word_index = {word: frozenset(symbols) for word, symbols in word_index.items()}
+        self.prediction_closure = []
+        self.closure_symbols = []
+        for symbol in range(symbol_count):
+            closure, symbols = self._closure(symbol)
+            self.prediction_closure.append(closure)
+            self.closure_symbols.append(symbols)
+
+    def intern(self, token: Token) -> int:
+        try:
+            return self.symbol_ids[token]
+        except KeyError:
+            symbol = self.symbol_ids[token] = len(self.symbols)
+            self.symbols.append(token)
+            return symbol
+
+    def _nullable(self) -> List[bool]:
+        nullable = [False] * len(self.symbols)
+        changed = True
+        while changed:
+            changed = False
+            for production, lhs in enumerate(self.lhs):
+                if not nullable[lhs] and all(nullable[tok] for tok in self.rhs[production]):
+                    nullable[lhs] = changed = True
+        return nullable
+
+    def _first(self) -> Tuple[List[FrozenSet[int]], List[FrozenSet[int]]]:
+        first: List[Set[int]] = [{symbol} if self.terminating[symbol] else set() for symbol in range(len(self.symbols))]
+        production_first: List[Set[int]] = [set() for _ in self.rhs]
+        changed = True
+        while changed:
+            changed = False
+            for production, lhs in enumerate(self.lhs):
+                # Preterminals are scanned whole, so their rules are never looked into
+                if self.terminating[lhs]:
+                    continue
+                symbols = production_first[production]
+                size = len(symbols)
+                for tok in self.rhs[production]:
+                    symbols |= first[tok]
+                    if not self.nullable[tok]:
+                        break
+                if len(symbols) != size or not symbols <= first[lhs]:
+                    first[lhs] |= symbols
+                    changed = True
+        return [frozenset(symbols) for symbols in first], [frozenset(symbols) for symbols in production_first]
+
+    def _closure(self, symbol: int) -> Tuple[Tuple[Tuple[int, int], ...], FrozenSet[int]]:
+        if self.terminating[symbol]:
+            return (), frozenset()
+        closure: List[Tuple[int, int]] = []
+        symbols = [symbol]
+        parents = {symbol: -1}
+        # symbols grows as we go, giving a breadth first walk in the order the parser would predict them
+        for predicted in symbols:
+            for production in self.rules_by_lhs[predicted]:
+                position = len(closure)
+                closure.append((production, parents[predicted]))
+                # The parser skips over nullable symbols, so anything they precede is predicted alongside them
+                for tok in self.rhs[production]:
+                    if not self.terminating[tok] and tok not in parents:
+                        parents[tok] = position
+                        symbols.append(tok)
+                    if not self.nullable[tok]:
+                        break
+        return tuple(closure), frozenset(symbols)
+
+    def symbol_of(self, rule: Rule) -> int:
+        # scanned rules are built from input tokens and carry no production
+        if rule.production is None:
+            return self.symbol_ids[rule.lhs]
+        return self.lhs[rule.production]
+
+    def next_symbol(self, rule: Rule) -> Optional[int]:
+        if rule.production is None or rule.is_completed():
+            return None
+        return self.rhs[rule.production][rule.dot_index]
+
+    def __getitem__(self, token: Token) -> List[Rule]:
+        symbol = self.symbol_ids[token]
+        if self.terminal[symbol]:
+            raise KeyError(token)
+        return [self.rules[production] for production in self.rules_by_lhs[symbol]]
+
+    def __contains__(self, token: object) -> bool:
+        symbol = self.symbol_ids.get(token) if isinstance(token, Token) else None
+        return symbol is not None and not self.terminal[symbol]
+
+    def __iter__(self) -> Iterator[Token]:
+        return (token for symbol, token in enumerate(self.symbols) if not self.terminal[symbol])
+
+    def __len__(self) -> int:
+        return self.terminal.count(False)
+
+    def keys(self) -> Iterator[Token]:
+        return iter(self)
+
+    def get(self, token: Token, default: Optional[List[Rule]]=None) -> Optional[List[Rule]]:
+        try:
+            return self[token]
+        except KeyError:
+            return default
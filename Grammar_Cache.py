@@ -0,0 +1,84 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Optional
+
+import EBNF_Grammar
+from EBNF_Tokenizer import EBNF_Tokenizer
+from EBNF_Visitor import EBNF_Visitor
+from Grammar import CompiledGrammar
+from Parser import Parser
+
+# Bump whenever CompiledGrammar, Rule or Token change shape, so stale cache files are never loaded
+FORMAT_VERSION = 6
+
+
+def default_cache_dir() -> str:
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'earley_parser')
+
+
+def compile_ebnf(text: str) -> CompiledGrammar:
+    """
+    Compiles the text of an EBNF grammar by parsing it with EBNF_Grammar and visiting the tree
+    """
+    tokens = EBNF_Tokenizer(text).tokenize()
+    grammar_parser = Parser(EBNF_Grammar.grammar, EBNF_Grammar.start_symbol)
+    grammar_error = grammar_parser.parse(tokens)
+    grammar_tree = grammar_parser.parse_tree()
+    if grammar_tree is None:
+        raise ValueError(f'There is no valid parse: {grammar_error}')
+    return CompiledGrammar(EBNF_Visitor().generate_grammar(grammar_tree))
+
+
+class Grammar_Cache:
+    """
+    An on-disk cache of compiled EBNF grammars, so a grammar file is only parsed again once it changes
+
+    Attributes:
+        cache_dir   The directory holding the cache files, created when first written to
+
+    Each file is the pickled CompiledGrammar, named after the sha256 of the format version and the grammar's text. A
+    changed grammar or format therefore never finds an old file, and files that cannot be loaded are rebuilt.
+    """
+
+    cache_dir: str
+
+    def __init__(self, cache_dir: Optional[str]=None) -> None:
+        self.cache_dir = cache_dir or default_cache_dir()
+
+    def path_for(self, text: str) -> str:
+        digest = hashlib.sha256(f'{FORMAT_VERSION}\n{text}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.pickle')
+
+    def load(self, grammar_file: str, rebuild: bool=False) -> CompiledGrammar:
+        """
+        Returns the compiled grammar of the file, from the cache unless rebuild is set or it has no usable entry
+        """
+        with open(grammar_file) as file:
+            text = file.read()
+        path = self.path_for(text)
+        if not rebuild:
+            try:
+                with open(path, 'rb') as cache_file:
+                    grammar = pickle.load(cache_file)
+                if isinstance(grammar, CompiledGrammar):
+                    return grammar
+            except Exception:
+                # A corrupt or incompatible entry is rebuilt like a missing one
+                pass
+        grammar = compile_ebnf(text)
+        self.store(path, grammar)
+        return grammar
+
+    def store(self, path: str, grammar: CompiledGrammar) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent runs never read a partly written entry
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as cache_file:
+                pickle.dump(grammar, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
@@ -0,0 +1,147 @@
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple, cast
+import sys
+
+from Grammar import CompiledGrammar
+from Rule import Token, Located_Token
+
+# Marks the trie node a terminal ends at - it maps to the terminal and the symbols that can scan it
+_END = ''
+# The trie edge matching any run of whitespace inside a multi-word terminal
+_SPACE = ' '
+
+_Trie = Dict[str, Any]
+
+
+class Tagged_Token(Located_Token):
+    """
+    A terminal read by a Grammar_Lexer, tagged with the symbols that can scan it
+
+    Attributes:
+        symbols     The ids of the terminal and preterminals of grammar that can scan the token, empty for text the
+                    grammar has no terminal for
+        grammar     The compiled grammar the ids refer to - a parser of any other grammar looks the token up itself
+
+    Copies and unpickled tokens lose their tags, becoming Located_Tokens, rather than carry the grammar with them.
+    """
+    __slots__ = ('symbols', 'grammar')
+
+    symbols: FrozenSet[int]
+    grammar: CompiledGrammar
+
+    def __new__(cls, value: str, symbols: FrozenSet[int], grammar: CompiledGrammar, line: int=0,
+                column: int=0) -> 'Tagged_Token':
+        token = cast(Tagged_Token, super().__new__(cls, '_TERMINAL', value, line, column))
+        token.symbols = symbols
+        token.grammar = grammar
+        return token
+
+    def __init__(self, value: str, symbols: FrozenSet[int], grammar: CompiledGrammar, line: int=0,
+                 column: int=0) -> None:
+        pass
+
+    def __reduce__(self) -> Tuple[type, Tuple[Any, ...]]:
+        return Located_Token, (self.token_type, self.value, self.line, self.column)
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class Grammar_Lexer:
+    """
+    A lexer built from the terminals of a grammar, which splits text into the longest terminals it can match, so
+    terminals of several words, ex. "New York", or of punctuation, ex. "," in "man, the", are read as single tokens.
+
+    Attributes:
+        grammar     The compiled grammar the terminals are taken from
+        trie        A character trie of the terminals, where a space matches any run of whitespace in the text
+
+    Terminals only end at a word boundary, so "man" is not read from "manager". Text no terminal matches is read a
+    word, or a single other character, at a time, and left for the parser to reject.
+    """
+
+    grammar: CompiledGrammar
+    trie: _Trie
+
+    def __init__(self, grammar: CompiledGrammar) -> None:
+        self.grammar = grammar
+        self.trie = {}
+        for symbol, token in enumerate(grammar.symbols):
+            if not grammar.terminal[symbol] or not token.is_terminal() or not token.value:
+                continue
+            words = token.value.split()
+            if not words:
+                continue
+            node = self.trie
+            for index, word in enumerate(words):
+                if index:
+                    node = node.setdefault(_SPACE, {})
+                for char in word:
+                    node = node.setdefault(char, {})
+            tags = grammar.word_index.get(token.value, frozenset()) | {symbol}
+            node[_END] = (token.value, frozenset(tags))
+
+    def iter_tokens(self, text: str) -> Iterator[Tagged_Token]:
+        """
+        Yields the tokens of the text in order, each tagged with the symbols that can scan it
+        """
+        position, length = 0, len(text)
+        line, line_start = 1, 0
+        while True:
+            start = position
+            while position < length and text[position].isspace():
+                position += 1
+            if position == length:
+                return
+            line, line_start = self.__advance_lines(text, start, position, line, line_start)
+            end, match = self.__longest_match(text, position)
+            column = position - line_start + 1
+            if match is None:
+                end = position + 1
+                if _is_word(text[position]):
+                    while end < length and _is_word(text[end]):
+                        end += 1
+                yield Tagged_Token(text[position:end], frozenset(), self.grammar, line, column)
+            else:
+                value, symbols = match
+                yield Tagged_Token(value, symbols, self.grammar, line, column)
+                line, line_start = self.__advance_lines(text, position, end, line, line_start)
+            position = end
+
+    def tokenize(self, text: str) -> List[Token]:
+        return list(self.iter_tokens(text))
+
+    def __longest_match(self, text: str, position: int) -> Tuple[int, Optional[Tuple[str, FrozenSet[int]]]]:
+        node = self.trie
+        best_end, best = position, None
+        length = len(text)
+        while position < length:
+            char = text[position]
+            if char.isspace():
+                node = node.get(_SPACE)
+                if node is None:
+                    break
+                while position < length and text[position].isspace():
+                    position += 1
+                continue
+            node = node.get(char)
+            if node is None:
+                break
+            position += 1
+            if _END in node and (position == length or not (_is_word(char) and _is_word(text[position]))):
+                best_end, best = position, node[_END]
+        return best_end, best
+
+    @staticmethod
+    def __advance_lines(text: str, start: int, end: int, line: int, line_start: int) -> Tuple[int, int]:
+        newlines = text.count('\n', start, end)
+        if newlines:
+            return line + newlines, text.rfind('\n', start, end) + 1
+        return line, line_start
+
+
+if __name__ == '__main__':
+    import simple_sentence
+    with open(sys.argv[1]) as input_file:
+        for token in Grammar_Lexer(CompiledGrammar(simple_sentence.grammar)).iter_tokens(input_file.read()):
+            print(token.line, token.column, token, sorted(str(token.grammar.symbols[tag]) for tag in token.symbols))
@@ -0,0 +1,146 @@
+from typing import Dict, List, Mapping, Optional, Set, Tuple, Union
+
+from Grammar import CompiledGrammar
+from Rule import Token, Rule
+
+# A production being optimized, as its rhs and the unit symbols collapsed into it, outermost first
+_Production = Tuple[Tuple[Token, ...], Tuple[Token, ...]]
+
+
+class Grammar_Optimizer:
+    """
+    Rewrites a grammar into an equivalent one the parser does less work on, compiled with what parse trees need to be
+    built in terms of the original symbols
+
+    Attributes:
+        grammar         The rules being optimized, as the productions of each symbol
+        start_symbol    The start symbol of the grammar
+
+    The passes are:
+        - Symbols that derive no sentence, and the rules using them, are removed
+        - Symbols the start symbol never reaches are removed
+        - Unit rules A -> B, where the rule is the only use of B, are replaced by A -> x for every rule B -> x, and B
+          is removed. B is recorded as collapsed into the new rules, so trees still show A -> B -> x. Rules into
+          terminals and preterminals, which are scanned rather than predicted, and into symbols on a cycle of unit
+          rules are kept. Symbols used more than once are kept too, as copying their rules would have the parser
+          predict them once per use.
+        - Duplicate alternatives of a symbol are merged
+
+    Symbols with an empty list of rules, such as EBNF_Grammar's identifier, are matched by tagged tokens and kept.
+    """
+
+    grammar: Dict[Token, List[_Production]]
+    start_symbol: Token
+
+    def __init__(self, grammar: Union[CompiledGrammar, Mapping[Token, List[Rule]]], start_symbol: Token) -> None:
+        # An already optimized grammar keeps the unit symbols collapsed into its rules
+        chains = grammar.unit_chains if isinstance(grammar, CompiledGrammar) else {}
+        self.grammar = {
+            token: [(rule.rhs, chains.get(rule.production, ()) if rule.production is not None else ())
+                    for rule in rules]
+            for token, rules in ((token, grammar[token]) for token in grammar.keys())
+        }
+        self.start_symbol = start_symbol
+
+    def optimize(self) -> CompiledGrammar:
+        self.remove_unproductive()
+        self.remove_unreachable()
+        self.merge_duplicates()
+        self.collapse_unit_rules()
+        self.remove_unreachable()
+        self.merge_duplicates()
+        rules = {token: [Rule(token, rhs) for rhs, _ in productions] for token, productions in self.grammar.items()}
+        chains = {token: [chain for _, chain in productions] for token, productions in self.grammar.items()}
+        return CompiledGrammar(rules, unit_chains=chains)
+
+    def remove_unproductive(self) -> None:
+        productive = {token for token, productions in self.grammar.items() if not productions}
+        changed = True
+        while changed:
+            changed = False
+            for token, productions in self.grammar.items():
+                if token not in productive and any(all(self.__produces(tok, productive) for tok in rhs)
+                                                   for rhs, _ in productions):
+                    productive.add(token)
+                    changed = True
+        if self.start_symbol not in productive:
+            raise ValueError(f'The start symbol {self.start_symbol} derives no sentence')
+        self.grammar = {
+            token: [(rhs, chain) for rhs, chain in productions if all(self.__produces(tok, productive) for tok in rhs)]
+            for token, productions in self.grammar.items() if token in productive
+        }
+
+    def __produces(self, token: Token, productive: Set[Token]) -> bool:
+        # Terminals have no rules of their own
+        return token in productive or token not in self.grammar
+
+    def remove_unreachable(self) -> None:
+        reachable = [self.start_symbol]
+        seen = {self.start_symbol}
+        for token in reachable:
+            for rhs, _ in self.grammar.get(token, ()):
+                for tok in rhs:
+                    if tok in self.grammar and tok not in seen:
+                        seen.add(tok)
+                        reachable.append(tok)
+        self.grammar = {token: productions for token, productions in self.grammar.items() if token in seen}
+
+    def merge_duplicates(self) -> None:
+        for token, productions in self.grammar.items():
+            # dict keys keep the first of each duplicate, in order
+            self.grammar[token] = list(dict.fromkeys(productions))
+
+    def collapse_unit_rules(self) -> None:
+        cyclic = self.__unit_cycles()
+        uses: Dict[Token, int] = {}
+        for productions in self.grammar.values():
+            for rhs, _ in productions:
+                for tok in rhs:
+                    uses[tok] = uses.get(tok, 0) + 1
+        collapsed: Dict[Token, List[_Production]] = {}
+
+        def collapse(token: Token) -> List[_Production]:
+            if token not in collapsed:
+                productions: List[_Production] = []
+                for rhs, chain in self.grammar[token]:
+                    target = self.__unit_target(rhs)
+                    if target is None or target in cyclic or uses[target] > 1 or target == self.start_symbol:
+                        productions.append((rhs, chain))
+                    else:
+                        productions.extend((inner_rhs, chain + (target,) + inner_chain)
+                                           for inner_rhs, inner_chain in collapse(target))
+                collapsed[token] = productions
+            return collapsed[token]
+
+        for token in self.grammar:
+            collapse(token)
+        self.grammar = collapsed
+
+    def __unit_target(self, rhs: Tuple[Token, ...]) -> Optional[Token]:
+        # The symbol a unit rule leads to, if the rule is one that may be collapsed - None otherwise
+        if len(rhs) != 1 or rhs[0] not in self.grammar:
+            return None
+        productions = self.grammar[rhs[0]]
+        if all(len(inner_rhs) <= 1 and all(tok not in self.grammar for tok in inner_rhs)
+               for inner_rhs, _ in productions):
+            return None
+        return rhs[0]
+
+    def __unit_cycles(self) -> Set[Token]:
+        # Symbols that reach themselves through unit rules alone
+        targets = {token: {target for target in (self.__unit_target(rhs) for rhs, _ in productions)
+                           if target is not None}
+                   for token, productions in self.grammar.items()}
+        cyclic = set()
+        for token in targets:
+            stack = list(targets[token])
+            seen: Set[Token] = set()
+            while stack:
+                target = stack.pop()
+                if target == token:
+                    cyclic.add(token)
+                    break
+                if target not in seen:
+                    seen.add(target)
+                    stack.extend(targets.get(target, ()))
+        return cyclic
@@ -1,107 +1,514 @@
 from argparse import ArgumentParser
-from typing import Callable, List, Dict, Optional, Set, Tuple
+from collections import deque
+import json
+from math import inf
+import sys
+from typing import (AbstractSet, Any, Callable, Deque, FrozenSet, Generator, Iterator, List, Dict, Mapping, Optional, Set, Tuple,
+                    Union)
 
+from Chart import Chart_Row, Compact_Row, Row
 import EBNF_Grammar
 from EBNF_Tokenizer import EBNF_Tokenizer
 from EBNF_Visitor import EBNF_Visitor
-from Rule import Token, Rule
-import simple_sentence
+from Forest import Forest_Node, Intermediate_Node, Symbol_Node
+from Grammar import CompiledGrammar
+from Grammar_Lexer import Grammar_Lexer, Tagged_Token
+from Rule import Located_Token, Token, Rule
+from Stats import Parser_Stats
 from simple_tokenizer import Simple_Tokenizer
 from Tree import Node
 
+# A tree yet to be built, as its root value and the derivations of its children
+_Derivation = Tuple[Token, Tuple[Any, ...]]
+# A stack as nested (top, rest) pairs, None when empty, so pushing onto it leaves the stack pushed onto unchanged
+_Stack = Optional[Tuple[Any, Any]]
+# The completed rules a tree is being built inside of that share the innermost one's span, with that span
+_Path = Tuple[Tuple[int, int], FrozenSet[Tuple[int, int]]]
+# The tasks of Parser.__iter_derivations
+_SUBTREE, _SEQUENCE, _BUILD, _WRAP, _LEAF = range(5)
+# A call made without recursion - a generator yielding the calls it would make, and sent back their results
+_Call = Generator[Any, Any, Any]
+
+
+def _run(call: _Call) -> Any:
+    # Runs the call and the calls it yields on an explicit stack, so chains of calls as long as the input fit within
+    # Python's recursion limit
+    stack = [call]
+    result = None
+    while True:
+        try:
+            inner = stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            if not stack:
+                return stop.value
+            result = stop.value
+            continue
+        stack.append(inner)
+        result = None
+
+
+class Parse_Error(ValueError):
+    """
+    Why a parse failed, returned rather than raised by Parser.parse
+
+    Attributes:
+        position    The index of the token that could not be parsed, or the input length if the input ended early
+        token       The token that could not be parsed, None if the input ended early
+        expected    The terminals and preterminals the last row still alive could have scanned
+    """
+
+    position: int
+    token: Optional[Token]
+    expected: Set[Token]
+
+    def __init__(self, position: int, token: Optional[Token], expected: Set[Token]) -> None:
+        self.position = position
+        self.token = token
+        self.expected = expected
+        expected_str = ', '.join(sorted(str(tok) for tok in expected)) or 'nothing'
+        if token is None:
+            super().__init__(f'Unexpected end of input at position {position}, expected one of {expected_str}')
+        else:
+            # Tokens read from a source text can say where the error is in it
+            where = f' ({token.location()})' if isinstance(token, Located_Token) else ''
+            super().__init__(f'Unexpected {token} at position {position}{where}, expected one of {expected_str}')
+
 class Parser:
     """
     An Earley parser implemented based on the algorithm in the text
 
     Attributes:
-        grammar             A dictionary containing our base ruleset
+        grammar             Our base ruleset, compiled - a rule dictionary passed in is compiled on construction
         terminals           A dictionary mapping terminal tokens to their values, generated from grammar
-        chart               The chart for our parse
+        chart               The chart for our parse, one row per token read so far plus the initial row
         input_tokens        The string to be parsed
-        current_position    The position in the parse
+        current_position    The position in the parse - the row last processed
+        error               Why the last parse failed, None if it succeeded or has not ended
+        leo                 Whether completion uses Leo's transitive items, making right recursion linear
+        packed              Whether a rule derived again is merged into the equivalent rule already in its row, keeping
+                            the new derivation as a link, rather than inserted as a duplicate. This keeps ambiguous
+                            charts polynomial - see parse_sppf
+        compact             Whether the chart stores rules as ints in arrays rather than as Rule objects, trading some
+                            speed for a much smaller chart on long inputs - see Chart.Compact_Row
+        lookahead           Whether predict only adds the productions that can begin with the token after the row, or
+                            derive the empty string, using the grammar's FIRST sets. Rows predicted before their next
+                            token is known, as when tokens are fed one at a time, are predicted in full
+        stats               Counters for the current parse, None unless the parser was built with stats or timings set,
+                            in which case timings also times each phase - see Stats.Parser_Stats
+
+    One parser can parse any number of inputs in turn, with parse(tokens), or reset() then feed. The rows of each
+    discarded chart are emptied and kept in a pool that new rows are taken from, sized to the longest of the last
+    few charts, so a long running parser stops allocating rows once it has seen inputs of the usual length. A chart
+    kept from an earlier parse is emptied when the next one starts.
     """
 
-    grammar: Dict[Token, List[Rule]]
+    grammar: CompiledGrammar
     terminals: Dict[Token, Set[str]]
-    chart: List[List[Rule]]
+    chart: List[Chart_Row]
     input_tokens: List[Token]
     start_symbol: Token
     current_position: int
+    error: Optional[Parse_Error]
+    leo: bool
+    packed: bool
+    compact: bool
+    lookahead: bool
+    stats: Optional[Parser_Stats]
+    __next_symbols: Optional[AbstractSet[int]]
+    __row_pool: List[Chart_Row]
+    __chart_lengths: Deque[int]
 
 
-    def __init__(self, grammar: Dict[Token, List[Rule]], start_symbol: Token,
-                 input_tokens: Optional[List[Token]]=None) -> None:
-        self.grammar = grammar
-        self.terminals = {
-            token : {literal.value for rule in self.grammar[token] for literal in rule.rhs if self.is_terminal(literal)}
-                    for token in self.grammar.keys()
-        }
-        if input_tokens:
-            self.chart = [[] for _ in range(len(input_tokens) + 1)]
-        self.input_tokens = input_tokens if input_tokens else []
+    def __init__(self, grammar: Union[CompiledGrammar, Mapping[Token, List[Rule]]], start_symbol: Token,
+                 input_tokens: Optional[List[Token]]=None, leo: bool=False, packed: bool=False,
+                 compact: bool=False, lookahead: bool=False, stats: bool=False, timings: bool=False) -> None:
+        self.grammar = grammar if isinstance(grammar, CompiledGrammar) else CompiledGrammar(grammar)
+        self.terminals = self.grammar.terminals
+        self.chart = []
+        self.input_tokens = list(input_tokens) if input_tokens else []
         self.start_symbol = start_symbol
         self.current_position = 0 # i in the text
+        self.error = None
+        self.leo = leo
+        self.packed = packed
+        self.compact = compact
+        self.lookahead = lookahead
+        self.__next_symbols = None
+        self.__row_pool = []
+        self.__chart_lengths = deque(maxlen=8)
+        self.stats = None
+        if stats or timings:
+            self.stats = Parser_Stats(timings)
 
     def is_terminal(self, token: Token) -> bool:
         return not token in self.grammar
 
     def is_terminating(self, token: Token) -> bool:
         # constituents are nonterminals producing nonterminals
-        return all([self.is_terminal(tok) for rule in self.grammar.get(token, []) for tok in rule.rhs])
+        symbol = self.grammar.symbol_ids.get(token)
+        return symbol is None or self.grammar.terminating[symbol]
 
-    def insert(self, rule: Rule) -> None:
-        rule.index = (rule.current_index, len(self.chart[rule.current_index]))
+    def insert(self, rule: Rule) -> Tuple[int, int]:
+        """
+        Inserts the rule into its row, returning the index it is stored at - that of the existing rule for a duplicate
+        """
+        row = self.chart[rule.current_index]
+        rule.index = (rule.current_index, len(row))
         # Avoid repeatedly inserting rules that are 'from xxx'
-        if rule.updated_rule or rule not in self.chart[rule.current_index]:
-            self.chart[rule.current_index].append(rule)
+        if rule.updated_rule and not self.packed or rule not in row:
+            row.append(rule, self.grammar.next_symbol(rule))
+            return rule.index
+        column = row.position(rule)
+        if rule.updated_rule:
+            row.add_link(column, rule.previous_rule, rule.updated_rule)
+        return rule.current_index, column
+
+    def derivations(self, rule: Rule) -> List[Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]]:
+        """
+        Returns every (previous_rule, updated_rule) pair deriving the rule - more than one only for packed parsers
+        """
+        if rule.index is None:
+            raise ValueError('derivations called with a rule that is not in the chart')
+        row, column = rule.index
+        return [(rule.previous_rule, rule.updated_rule)] + self.chart[row].links_of(column)
 
     def predict(self, rule: Rule) -> None:
-        tok = rule.get_current_token()
-        if tok is None:
+        symbol = self.grammar.next_symbol(rule)
+        if symbol is None:
             raise ValueError('Predict cannot be called with a completed rule')
-        for descendant_rule in self.grammar[tok]:
+        predicted = self.chart[self.current_position].predicted
+        if symbol in predicted:
+            return
+        # Add the whole closure at once, skipping symbols an earlier prediction in this row already covered
+        new_symbols = self.grammar.closure_symbols[symbol] - predicted
+        predicted |= new_symbols
+        indices: List[Optional[Tuple[int, int]]] = []
+        next_symbols = self.__next_symbols
+        for production, parent in self.grammar.prediction_closure[symbol]:
+            if self.grammar.lhs[production] not in new_symbols:
+                indices.append(None)
+                continue
+            # A production that can neither scan the next token nor complete empty would never leave this row
+            if next_symbols is not None and not self.grammar.production_nullable[production] \
+                    and self.grammar.production_first[production].isdisjoint(next_symbols):
+                indices.append(None)
+                continue
+            descendant_rule = self.grammar.rules[production]
+            previous_rule = indices[parent] if parent >= 0 and indices[parent] else rule.index
             new_rule = Rule(descendant_rule.lhs, descendant_rule.rhs, self.current_position, self.current_position,
-                            previous_rule=rule.index)
-            self.insert(new_rule)
+                            previous_rule=previous_rule, production=production)
+            index = self.insert(new_rule)
+            if self.stats is not None:
+                self.stats.record('predict', index != new_rule.index)
+            indices.append(index)
 
     def extend_others(self, completed_rule: Rule) -> None:
-        is_waiting = lambda rule: rule.get_current_token() == completed_rule.lhs
-        waiting_rules = [rule for  rule in self.chart[completed_rule.start_index] if is_waiting(rule)]
-        for waiting_rule in waiting_rules:
-            self.insert(Rule(waiting_rule.lhs, waiting_rule.rhs,
-                             waiting_rule.start_index, completed_rule.current_index, dot_index=waiting_rule.dot_index+1,
-                             previous_rule=completed_rule.index, updated_rule=waiting_rule.index))
-
-    def scan_input(self, rule: Rule) -> None:
+        # Completions that span nothing were already accounted for when skip_nullable advanced past their symbol
+        if completed_rule.start_index == completed_rule.current_index:
+            return
+        symbol = self.grammar.symbol_of(completed_rule)
+        # Past the check above the origin row is finished, so its transitive items are final
+        if self.leo:
+            top_index = self.leo_item(completed_rule.start_index, symbol)
+            if top_index is not None:
+                top_rule = self.get_rule(top_index)
+                new_rule = Rule(top_rule.lhs, top_rule.rhs, top_rule.start_index, completed_rule.current_index,
+                                dot_index=top_rule.dot_index+1, previous_rule=completed_rule.index,
+                                updated_rule=top_index, production=top_rule.production)
+                index = self.insert(new_rule)
+                if self.stats is not None:
+                    self.stats.record('complete', index != new_rule.index)
+                return
+        # When the origin row is the row being processed, rules it gains while we iterate are advanced too
+        for waiting_rule in self.chart[completed_rule.start_index].waiting_on(symbol):
+            new_rule = Rule(waiting_rule.lhs, waiting_rule.rhs,
+                            waiting_rule.start_index, completed_rule.current_index, dot_index=waiting_rule.dot_index+1,
+                            previous_rule=completed_rule.index, updated_rule=waiting_rule.index,
+                            production=waiting_rule.production)
+            index = self.insert(new_rule)
+            if self.stats is not None:
+                self.stats.record('complete', index != new_rule.index)
+
+    def skip_nullable(self, rule: Rule) -> None:
+        """
+        Advances the rule over the nullable symbol after its dot, as Aycock and Horspool describe, so that rules waiting
+        on a symbol completing with an empty span are advanced whatever order the row is processed in
+        """
+        new_rule = Rule(rule.lhs, rule.rhs, rule.start_index, rule.current_index, dot_index=rule.dot_index+1,
+                        updated_rule=rule.index, production=rule.production)
+        index = self.insert(new_rule)
+        if self.stats is not None:
+            self.stats.record('skip', index != new_rule.index)
+
+    def leo_item(self, row_index: int, symbol: int) -> Optional[Tuple[int, int]]:
+        """
+        Returns the index of the topmost rule on the deterministic reduction path above symbol in the given row, if any.
+        A rule is on the path when it is the only rule of its row waiting on the symbol and that symbol is its last, so
+        completing the symbol can only ever complete it, and so on upwards. Results are memoized on the row.
+        """
+        path: List[Tuple[Chart_Row, int]] = []
+        top_index: Optional[Tuple[int, int]] = None
+        while True:
+            row = self.chart[row_index]
+            if symbol in row.transitive:
+                top_index = row.transitive[symbol]
+                break
+            waiting = row.waiting_on(symbol)
+            if len(waiting) != 1 or waiting[0].dot_index != len(waiting[0].rhs) - 1:
+                row.transitive[symbol] = None
+                break
+            waiting_rule, = waiting
+            path.append((row, symbol))
+            row_index, symbol = waiting_rule.start_index, self.grammar.lhs[waiting_rule.production]
+            # The start symbol must be completed over the whole input for is_complete to find it, so never skip it
+            if row_index == 0 and waiting_rule.lhs == self.start_symbol:
+                break
+        if not path:
+            return top_index
+        # Every row walked through shares the same topmost rule, the last one found if nothing above it was memoized
+        if top_index is None:
+            last_row, last_symbol = path[-1]
+            top_index = last_row.waiting_on(last_symbol)[0].index
+        for row, walked_symbol in path:
+            row.transitive[walked_symbol] = top_index
+        return top_index
+
+    def scan(self) -> None:
+        """
+        Scans the token after the current row into the next row. The token's terminal and the preterminals listing it
+        are looked up once, and each one some rule of the row is waiting on is scanned, in the order the row first
+        waited on them, so the cost does not depend on the size of the lexicon or how many symbols were predicted.
+        """
         try:
-            next_token = self.input_tokens[rule.current_index]
+            next_token = self.input_tokens[self.current_position]
         except IndexError:
             return
-        if next_token == rule.get_current_token()\
-                or (rule.get_current_token() in self.terminals and next_token.value in self.terminals[rule.get_current_token()]):
-            self.insert(Rule(rule.get_current_token(), [next_token], rule.current_index, rule.current_index+1, dot_index=1))
-
-    def parse(self, input_tokens: Optional[List[Token]]=None) -> None:
-        if input_tokens:
-            self.input_tokens = input_tokens
-            self.chart = [[] for _ in range(len(input_tokens) + 1)]
-        for start_rule in self.grammar[self.start_symbol]:
-            self.insert(start_rule)
-        while self.current_position <= len(self.input_tokens):
-            for rule in self.chart[self.current_position]:
-                if rule.is_completed():
+        row = self.chart[self.current_position]
+        scanned = []
+        for symbol in self.__matching_symbols(next_token):
+            column = row.first_waiting(symbol)
+            if column is not None:
+                scanned.append((column, symbol))
+        for _, symbol in sorted(scanned):
+            new_rule = Rule(self.grammar.symbols[symbol], [next_token], self.current_position,
+                            self.current_position + 1, dot_index=1)
+            index = self.insert(new_rule)
+            if self.stats is not None:
+                self.stats.record('scan', index != new_rule.index)
+
+    def __matching_symbols(self, token: Token) -> AbstractSet[int]:
+        # The terminals and preterminals that can scan the token - a Grammar_Lexer already tagged its tokens with them
+        if isinstance(token, Tagged_Token) and token.grammar is self.grammar:
+            return token.symbols
+        symbols = set(self.grammar.word_index.get(token.value, ())) if token.value is not None else set()
+        # The token itself matches its terminal, or the preterminal it is already tagged with
+        tagged = self.grammar.symbol_ids.get(token)
+        if tagged is not None and self.grammar.terminating[tagged]:
+            symbols.add(tagged)
+        return symbols
+
+    def parse(self, input_tokens: Optional[List[Token]]=None) -> Optional[Parse_Error]:
+        """
+        Parses the input, stopping at the first token no rule can scan, and returns why the parse failed, if it did
+        """
+        if input_tokens is not None:
+            # Filled in place, as compact rows in the pool share the list
+            self.input_tokens[:] = input_tokens
+        self.start()
+        while self.current_position < len(self.input_tokens) and self.is_viable():
+            self.advance()
+        return self.__final_error()
+
+    def start(self) -> None:
+        """
+        Begins a parse from the start symbol, discarding any previous chart
+        """
+        self.__recycle_chart()
+        self.chart.append(self.__new_row())
+        self.current_position = 0
+        self.error = None
+        if self.stats is not None:
+            self.stats = Parser_Stats(self.stats.timings is not None)
+        for production in self.grammar.rules_by_lhs[self.grammar.symbol_ids[self.start_symbol]]:
+            start_rule = self.grammar.rules[production]
+            new_rule = Rule(start_rule.lhs, start_rule.rhs, production=production)
+            index = self.insert(new_rule)
+            if self.stats is not None:
+                self.stats.record('predict', index != new_rule.index)
+        self.process_row()
+
+    def reset(self) -> None:
+        """
+        Discards the current parse and its input, so the parser can be fed the tokens of a new one
+        """
+        self.__recycle_chart()
+        self.input_tokens.clear()
+        self.current_position = 0
+        self.error = None
+
+    def update(self, start: int, end: int, new_tokens: List[Token]) -> Optional[Parse_Error]:
+        """
+        Replaces the input tokens from start up to end with new_tokens and parses again, returning why the parse failed,
+        if it did. A row only depends on the tokens before it, so the rows up to start are kept and only the rest of the
+        chart is rebuilt - with lookahead a row also depends on the token after it, so the row at start is rebuilt too.
+        The chart, trees and errors are those a full parse of the new input would give.
+        """
+        if not 0 <= start <= end <= len(self.input_tokens):
+            raise ValueError(f'Cannot replace tokens {start} to {end} of an input of {len(self.input_tokens)} tokens')
+        self.input_tokens[start:end] = new_tokens
+        if not self.chart:
+            return self.parse()
+        # A parse that died early has no rows past the one that emptied, and they would still be empty
+        kept = min(start + 1 if not self.lookahead else start, len(self.chart))
+        if kept == 0:
+            return self.parse()
+        self.__recycle_rows(self.chart[kept:])
+        del self.chart[kept:]
+        if self.stats is not None:
+            del self.stats.row_items[kept:]
+        self.current_position = kept - 1
+        self.error = None
+        while self.current_position < len(self.input_tokens) and self.is_viable():
+            self.advance()
+        return self.__final_error()
+
+    def __recycle_chart(self) -> None:
+        if self.chart:
+            self.__chart_lengths.append(len(self.chart))
+            self.__recycle_rows(self.chart)
+        self.chart = []
+
+    def __recycle_rows(self, rows: List[Chart_Row]) -> None:
+        # Only as many rows as recent charts needed are kept, so once a long input drops out of the recent lengths
+        # the pool shrinks back rather than pinning its rows forever
+        limit = max(self.__chart_lengths, default=len(rows))
+        for row in rows[:limit - len(self.__row_pool)]:
+            row.clear()
+            self.__row_pool.append(row)
+        del self.__row_pool[limit:]
+
+    def advance(self) -> None:
+        """
+        Scans the token at the current position into a new row, then processes that row
+        """
+        self.chart.append(self.__new_row())
+        if self.stats is not None and self.stats.timings is not None:
+            self.stats.timed('scan', self.scan)
+        else:
+            self.scan()
+        self.current_position += 1
+        self.process_row()
+
+    def __new_row(self) -> Chart_Row:
+        if self.__row_pool and isinstance(self.__row_pool[-1], Compact_Row) == self.compact:
+            row = self.__row_pool.pop()
+            if isinstance(row, Compact_Row):
+                row.row_index = len(self.chart)
+            return row
+        if self.compact:
+            return Compact_Row(self.grammar, self.input_tokens, len(self.chart))
+        return Row()
+
+    def process_row(self) -> None:
+        """
+        Predicts and completes the current row. Rules waiting on a token are left for scan, once the token after the
+        row is known.
+        """
+        terminating = self.grammar.terminating
+        nullable = self.grammar.nullable
+        rhs = self.grammar.rhs
+        row = self.chart[self.current_position]
+        self.__next_symbols = None
+        if self.lookahead and self.current_position < len(self.input_tokens):
+            self.__next_symbols = self.__matching_symbols(self.input_tokens[self.current_position])
+        # Timing each step is left to its own branch, so untimed parses only pay for the check
+        stats = self.stats
+        timer = stats if stats is not None and stats.timings is not None else None
+        for rule in row:
+            if rule.is_completed():
+                if timer is not None:
+                    timer.timed('complete', self.extend_others, rule)
+                else:
                     self.extend_others(rule)
-                elif self.is_terminating(rule.get_current_token()):
-                    self.scan_input(rule)
+                continue
+            symbol = rhs[rule.production][rule.dot_index]
+            if not terminating[symbol]:
+                if timer is not None:
+                    timer.timed('predict', self.predict, rule)
                 else:
                     self.predict(rule)
-            self.current_position += 1
+            if nullable[symbol]:
+                if timer is not None:
+                    timer.timed('skip', self.skip_nullable, rule)
+                else:
+                    self.skip_nullable(rule)
+        if stats is not None:
+            stats.row_items.append(len(row))
+
+    def feed(self, token: Token) -> bool:
+        """
+        Parses one more token, starting the parse first if needed, and returns whether the input read so far is still
+        the prefix of some sentence of the grammar - once it is not, no further token can make the parse complete
+        """
+        if not self.chart:
+            self.start()
+        self.input_tokens.append(token)
+        # Once a row is empty the input can only stay invalid, so further tokens are not parsed at all
+        if self.is_viable():
+            self.advance()
+            if not self.is_viable():
+                self.error = self.__error(len(self.input_tokens) - 1)
+        return self.is_viable()
+
+    def finish(self) -> bool:
+        """
+        Ends a parse fed token by token, returning whether the tokens fed form a complete parse
+        """
+        if not self.chart:
+            self.start()
+        self.__final_error()
+        return self.is_complete()
+
+    def __final_error(self) -> Optional[Parse_Error]:
+        if self.error is None and not self.is_complete():
+            if self.is_viable():
+                self.error = self.__error(len(self.input_tokens))
+            else:
+                self.error = self.__error(max(len(self.chart) - 2, 0))
+        return self.error
+
+    def __error(self, position: int) -> Parse_Error:
+        # The row a token is scanned from is the one at its own position
+        token = self.input_tokens[position] if position < len(self.input_tokens) else None
+        return Parse_Error(position, token, self.__scannable(position))
+
+    def is_viable(self) -> bool:
+        # Every rule in a row extends a rule of the row before it, back to the start rules, so a non empty row
+        # means the tokens so far begin some parse
+        return bool(self.chart) and bool(self.chart[-1])
+
+    def expected_terminals(self) -> Set[Token]:
+        """
+        Returns the terminals and preterminals that the next token could match
+        """
+        if not self.chart:
+            self.start()
+        return self.__scannable(len(self.chart) - 1)
+
+    def __scannable(self, position: int) -> Set[Token]:
+        symbols, terminating = self.grammar.symbols, self.grammar.terminating
+        if self.lookahead:
+            # Productions lookahead left out of the row are still expected, through the symbols predicting them
+            first = self.grammar.first
+            return {symbols[tok] for symbol in self.chart[position].waiting_symbols() for tok in first[symbol]}
+        return {symbols[symbol] for symbol in self.chart[position].waiting_symbols() if terminating[symbol]}
 
     def is_complete(self) -> bool:
         if not any(self.chart):
             self.parse()
         completed: Callable[[Rule], bool] = lambda rule: rule.lhs == self.start_symbol and rule.start_index == 0 \
-                                 and rule.current_index == len(self.input_tokens)
+                                 and rule.current_index == len(self.input_tokens) and rule.is_completed()
         return any([completed(rule) for rule in self.chart[-1]])
 
     def get_rule(self, index: Optional[Tuple[int, int]]) -> Rule:
@@ -115,104 +522,534 @@ class Parser:
             raise e
 
 
-    def __make_node(self, rule: Rule) -> Node[Token]:
+    def __build_trees(self, roots: List[Rule]) -> List[Node[Token]]:
+        """
+        Builds the tree of each completed root rule, walking the chart with an explicit stack rather than recursion, so
+        trees as deep as the input is long can be built. The node of each completed rule, and the node each rule's
+        symbol before its dot gets, is built once and shared by every tree using it. A shared node has no one parent, so
+        its parent is None; every other node's is the node it is a child of.
+        """
+        # Keyed by chart index, which every rule in the chart has
+        nodes: Dict[Optional[Tuple[int, int]], Node[Token]] = {}
+        children: Dict[Optional[Tuple[int, int]], Node[Token]] = {}
+        attached: Set[Node[Token]] = set()
+        trees = []
+        for root in roots:
+            # (whether the entry is for a completed rule's node rather than a sibling's child, the rule, and once the
+            # nodes it is built from are on the stack, the rules to build it from with the siblings of each)
+            stack: List[Tuple[bool, Rule, Optional[List[Tuple[Rule, List[Rule]]]]]] = [(True, root, None)]
+            while stack:
+                is_node, rule, groups = stack.pop()
+                built = nodes if is_node else children
+                if rule.index in built:
+                    continue
+                if groups is not None:
+                    built[rule.index] = self.__make_node(rule, groups[0][1], children, attached) if is_node \
+                        else self.__make_child(rule, groups, nodes, children, attached)
+                elif is_node:
+                    siblings = self.__siblings(rule)
+                    stack.append((is_node, rule, [(rule, siblings)]))
+                    stack.extend((False, sibling, None) for sibling in siblings)
+                elif rule.previous_rule is None or rule.updated_rule is None:
+                    # skipped over a nullable symbol, which derives nothing
+                    children[rule.index] = Node(rule.rhs[rule.dot_index - 1])
+                else:
+                    child = self.get_rule(rule.previous_rule)
+                    # A Leo completion skipped the rules between the child and the rule it updated - their nodes are
+                    # rebuilt around the child's
+                    groups = [(link, self.__siblings(link)) for link in self.__leo_links(child, rule.updated_rule)]
+                    stack.append((is_node, rule, groups))
+                    stack.append((True, child, None))
+                    stack.extend((False, sibling, None) for _, siblings in groups for sibling in siblings)
+            trees.append(nodes[root.index])
+        return trees
 
-        # Handle all previous rules
+    def __siblings(self, rule: Rule) -> List[Rule]:
+        # The rule and the rules it advanced from, first to last, which the nodes of its children are keyed by
         previous_siblings = []
         iterator = rule
         while iterator.updated_rule:
-            previous_siblings.append(iterator)
+            # This check is needed to avoid double counting terminals at the end of a tagged string
+            if not self.is_terminal(iterator.lhs):
+                previous_siblings.append(iterator)
             iterator = self.get_rule(iterator.updated_rule)
+        previous_siblings.reverse()
+        return previous_siblings
+
+    def __make_node(self, rule: Rule, siblings: List[Rule],
+                    children: Dict[Optional[Tuple[int, int]], Node[Token]], attached: Set[Node[Token]]) -> Node[Token]:
 
         # Make the node corresponding to the input rule
-        new_parent_node = Node(rule.lhs)
-
-        if previous_siblings:
-            while previous_siblings:
-                sibling = previous_siblings.pop()
-                # This check is needed to avoid double counting terminals at the end of a tagged string
-                if not self.is_terminal(sibling.lhs):
-                    new_parent_node.append_node(self.__make_node(self.get_rule(sibling.previous_rule)))
-        else:
+        if rule.production is None:
+            # Scanned rules are leaves, the input token tagged with the symbol scanned
+            new_parent_node = Node(rule.lhs)
             previous_token = rule.get_previous_token()
             if previous_token:
-                new_parent_node.value = Token(rule.lhs.token_type, value=previous_token.value)
+                new_parent_node.value = previous_token.retyped(rule.lhs.token_type)
             # if previous_token and self.is_terminal(previous_token) and not previous_token == rule.lhs:
             #     new_parent_node.add_child(rule.get_previous_token())
+            return new_parent_node
+
+        # Completed rules of empty productions have no siblings, but may still have collapsed unit rules to rebuild
+        return self.__unit_node(rule, [children[sibling.index] for sibling in siblings], attached)
 
-        return new_parent_node
+    def __unit_node(self, rule: Rule, children: List[Node[Token]], attached: Set[Node[Token]]) -> Node[Token]:
+        # Rebuilds the unit rules an optimizer collapsed into the rule's production between it and its children.
+        # attached holds the children given a parent so far, which lose it again if attached anywhere else.
+        node = parent = Node(rule.lhs)
+        for symbol in self.grammar.unit_chains.get(rule.production, ()) if rule.production is not None else ():
+            unit_node = Node(symbol)
+            parent.append_node(unit_node)
+            parent = unit_node
+        for child in children:
+            if child in attached:
+                child.parent = None
+            else:
+                child.parent = parent
+                attached.add(child)
+            parent.children.append(child)
+        return node
+
+    def __make_child(self, sibling: Rule, links: List[Tuple[Rule, List[Rule]]],
+                     nodes: Dict[Optional[Tuple[int, int]], Node[Token]],
+                     children: Dict[Optional[Tuple[int, int]], Node[Token]],
+                     attached: Set[Node[Token]]) -> Node[Token]:
+        child_node = nodes[sibling.previous_rule]
+        for link, link_siblings in links:
+            child_node = self.__unit_node(link, [children[link_sibling.index] for link_sibling in link_siblings]
+                                          + [child_node], attached)
+        return child_node
 
     def parse_tree(self) -> Optional[Node[Token]]:
         if not any(self.chart):
             self.parse()
         try:
             completed = lambda rule: rule.lhs == self.start_symbol and rule.start_index == 0 \
-                                     and rule.current_index == len(self.input_tokens)
+                                     and rule.current_index == len(self.input_tokens) and rule.is_completed()
             completed_parse = next(rule for rule in self.chart[-1] if completed(rule))
-            return self.__make_node(completed_parse)
+            return self.__build_trees([completed_parse])[0]
         except StopIteration:
             return None
 
     def parse_forest(self) -> List[Node[Token]]:
+        """
+        Returns a tree for each completed parse in the last row. Subtrees the trees have in common are built once and
+        shared between them, so the trees should be treated as read only - a shared subtree's root has no parent.
+        """
         if not any(self.chart):
             self.parse()
         completed = lambda rule: rule.lhs == self.start_symbol and rule.start_index == 0 \
-                                 and rule.current_index == len(self.input_tokens)
-        return [self.__make_node(rule) for rule in self.chart[-1] if completed(rule)]
+                                 and rule.current_index == len(self.input_tokens) and rule.is_completed()
+        return self.__build_trees([rule for rule in self.chart[-1] if completed(rule)])
 
-    def __str__(self) -> str:
-        def _token(index: int) -> str:
-            return 'ℇ' if index <= 0 else self.input_tokens[index - 1]
-        rows = [[f'Row {index}: {_token(index)}'] + [str(rule) for rule in row] for index, row in enumerate(self.chart)]
-        return '\n'.join(['\n'.join(row) for row in rows])
+    def iter_parse_trees(self, limit: Optional[int]=None) -> Iterator[Node[Token]]:
+        """
+        Yields the parse trees one at a time, building each only when it is requested, up to limit trees if given.
+        Unlike parse_forest this also follows the extra derivations packed parsers record, so it yields every reading.
+        Derivations that cycle back into a rule they are already inside of are not followed. Trees are enumerated with
+        explicit stacks, so inputs of any length fit within Python's recursion limit, and each takes time linear in its
+        size.
+        """
+        if not any(self.chart):
+            self.parse()
+        count = 0
+        for rule in self.chart[-1]:
+            if rule.lhs == self.start_symbol and rule.start_index == 0 \
+                    and rule.current_index == len(self.input_tokens) and rule.is_completed():
+                for derivation in self.__iter_derivations(rule):
+                    if limit is not None and count >= limit:
+                        return
+                    yield self.__build_tree(derivation)
+                    count += 1
 
+    def __build_tree(self, derivation: _Derivation) -> Node[Token]:
+        value, children = derivation
+        root = Node(value)
+        stack = [(root, children)]
+        while stack:
+            node, children = stack.pop()
+            for value, grandchildren in children:
+                child = Node(value)
+                node.append_node(child)
+                stack.append((child, grandchildren))
+        return root
 
+    def __iter_derivations(self, root: Rule) -> Iterator[_Derivation]:
+        """
+        Yields the derivation of each tree of the completed root rule, by depth first search over the choice of
+        derivation each rule in the tree was made by, backtracking to the last choice with alternatives left once a
+        tree is built or cannot be. The tasks left to do and the derivations built so far are kept on linked stacks of
+        tuples, so each choice keeps the state it was made in at no cost, and the choice made last varies fastest, as
+        in nested loops over the choices.
+        """
+        # Tasks are (_SUBTREE, rule, path), (_SEQUENCE, rule, path), (_BUILD, rule), (_WRAP, link) and (_LEAF, token)
+        tasks: _Stack = ((_SUBTREE, root, None), None)
+        values: _Stack = None
+        # Each choice: the tasks and values it was made with, the rule, its path, its derivations and the next to try
+        choices: List[List[Any]] = []
+        while True:
+            failed = False
+            if tasks is None:
+                yield values[0]
+                failed = True
+            else:
+                task, tasks = tasks
+                kind = task[0]
+                if kind == _SUBTREE:
+                    _, rule, path = task
+                    previous_token = rule.get_previous_token()
+                    if rule.production is None and previous_token:
+                        values = ((previous_token.retyped(rule.lhs.token_type), ()), values)
+                    else:
+                        path = self.__enter(rule, path)
+                        if path is None:
+                            failed = True
+                        else:
+                            tasks = ((_SEQUENCE, rule, path), ((_BUILD, rule), tasks))
+                elif kind == _SEQUENCE:
+                    _, rule, path = task
+                    derivations = self.derivations(rule)
+                    if len(derivations) > 1:
+                        choices.append([tasks, values, rule, path, derivations, 1])
+                    tasks = self.__derive(rule, derivations[0], path, tasks)
+                elif kind == _LEAF:
+                    values = ((task[1], ()), values)
+                else:
+                    rule = task[1]
+                    # A rule takes the children its sequence pushed, and a link wrapping a child the child as well,
+                    # which was pushed before them
+                    children: List[_Derivation] = []
+                    for _ in range(rule.dot_index if kind == _BUILD else rule.dot_index + 1):
+                        child, values = values
+                        children.append(child)
+                    if kind == _BUILD:
+                        children.reverse()
+                    else:
+                        children[:-1] = reversed(children[:-1])
+                    values = (self.__unit_derivation(rule, tuple(children)), values)
+            if failed:
+                while choices and choices[-1][5] >= len(choices[-1][4]):
+                    choices.pop()
+                if not choices:
+                    return
+                choice = choices[-1]
+                tasks, values, rule, path, derivations, position = choice
+                choice[5] += 1
+                tasks = self.__derive(rule, derivations[position], path, tasks)
 
-if __name__ =='__main__':
-    parser = ArgumentParser(description='Parse a grammar and generate corresponding trees')
-    parser.add_argument('-g', '--grammar-file', help='Read a grammar file written in EBNF')
-    parser.add_argument('-s', '--start-symbol', help='The start symbol for the grammar, default S', default='S')
-    parser.add_argument('input_file', help='File containing the string to be parsed')
+    def __enter(self, rule: Rule, path: Optional[_Path]) -> Optional[_Path]:
+        # The path inside the rule, or None if the rule is already on it. A rule can only be inside another over the
+        # same span as it, and spans only shrink going down a tree, so the path only holds the innermost rules sharing a
+        # span.
+        if rule.index is None:
+            return None
+        span = (rule.start_index, rule.current_index)
+        if path is None or path[0] != span:
+            return span, frozenset((rule.index,))
+        if rule.index in path[1]:
+            return None
+        return span, path[1] | {rule.index}
 
-    args = parser.parse_args()
+    def __derive(self, rule: Rule, derivation: Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]],
+                 path: _Path, tasks: _Stack) -> _Stack:
+        # Pushes the tasks building the rule's children by the given derivation - those of the rule it advanced from,
+        # then the child it advanced over
+        previous_rule, updated_rule = derivation
+        if updated_rule is None:
+            return tasks
+        if previous_rule is None:
+            tasks = ((_LEAF, rule.rhs[rule.dot_index - 1]), tasks)
+        else:
+            child = self.get_rule(previous_rule)
+            links = self.__leo_links(child, updated_rule)
+            for link in reversed(links):
+                tasks = ((_SEQUENCE, link, path), ((_WRAP, link), tasks))
+            tasks = ((_SUBTREE, child, path), tasks)
+        return ((_SEQUENCE, self.get_rule(updated_rule), path), tasks)
 
-    if args.grammar_file:
-        with open(args.grammar_file) as grammar_file:
-            ebnf_tokenizer = EBNF_Tokenizer(grammar_file)
-            tokens = ebnf_tokenizer.tokenize()
-            grammar_parser = Parser(EBNF_Grammar.grammar, EBNF_Grammar.start_symbol)
-            grammar_parser.parse(tokens)
-            grammar_tree = grammar_parser.parse_tree()
-            if grammar_tree is None:
-                raise ValueError('There is no valid parse')
-            grammar_visitor = EBNF_Visitor()
-            new_grammar = grammar_visitor.generate_grammar(grammar_tree)
-    else:
-        new_grammar = simple_sentence.grammar
+    def __unit_derivation(self, rule: Rule, children: Tuple[_Derivation, ...]) -> _Derivation:
+        # As __unit_node does for built trees
+        if rule.production is not None:
+            for symbol in reversed(self.grammar.unit_chains.get(rule.production, ())):
+                children = ((symbol, children),)
+        return rule.lhs, children
 
-    start_symbol = args.start_symbol
+    def __leo_links(self, child: Rule, updated_rule: Tuple[int, int]) -> List[Rule]:
+        # The rules a Leo completion skipped between the child and the rule it updated, bottom up - none when the
+        # child completed the updated rule directly
+        waiting_rule = self.get_rule(updated_rule)
+        symbol = self.grammar.symbol_of(child)
+        if waiting_rule.current_index == child.start_index and self.grammar.next_symbol(waiting_rule) == symbol:
+            return []
+        links = []
+        row_index = child.start_index
+        while True:
+            link, = self.chart[row_index].waiting_on(symbol)
+            if link.index == updated_rule:
+                return links
+            links.append(link)
+            row_index, symbol = link.start_index, self.grammar.lhs[link.production]
 
-    with open(args.input_file) as input_file:
-        tokenizer = Simple_Tokenizer(input_file.read())
-        tokens = tokenizer.tokenize()
-        earley_parser = Parser(new_grammar, Token(start_symbol), tokens)
+    def count_parses(self) -> Union[int, float]:
+        """
+        Counts the parse trees by dynamic programming over the chart, without building any. A derivation reaching a
+        rule it is already inside of, through unit or empty rules deriving themselves, can be repeated any number of
+        times, so when the chart has one the count is unbounded and math.inf is returned - iter_parse_trees yields the
+        finitely many trees that do not repeat one. Otherwise the count is what iter_parse_trees yields.
+        """
+        if not any(self.chart):
+            self.parse()
+        counts: Dict[Tuple[int, int], Union[int, float]] = {}
+        return sum(_run(self.__count(rule, counts, set())) for rule in self.chart[-1]
+                   if rule.lhs == self.start_symbol and rule.start_index == 0
+                   and rule.current_index == len(self.input_tokens) and rule.is_completed())
 
-    earley_parser.parse()
-    print(earley_parser)
+    def __count(self, rule: Rule, counts: Dict[Tuple[int, int], Union[int, float]],
+                active: Set[Tuple[int, int]]) -> _Call:
+        # The number of distinct derivations of the part of the rule before its dot. Every rule in the chart has at
+        # least one, so a cycle makes the count infinite whatever it is multiplied by. Rules are memoized only once
+        # fully counted, and active holds the rules still being counted. Run by _run, so yields the counts it needs.
+        if rule.index is None:
+            raise ValueError('count requested for a rule that is not in the chart')
+        if rule.index in counts:
+            return counts[rule.index]
+        if rule.index in active:
+            return inf
+        active.add(rule.index)
+        total: Union[int, float] = 0
+        for previous_rule, updated_rule in self.derivations(rule):
+            if updated_rule is None:
+                total += 1
+                continue
+            prefixes = yield self.__count(self.get_rule(updated_rule), counts, active)
+            if previous_rule is None:
+                total += prefixes
+                continue
+            child = self.get_rule(previous_rule)
+            children = yield self.__count(child, counts, active)
+            for link in self.__leo_links(child, updated_rule):
+                children *= yield self.__count(link, counts, active)
+            total += prefixes * children
+        active.remove(rule.index)
+        counts[rule.index] = total
+        return total
+
+    def parse_sppf(self) -> Optional[Symbol_Node]:
+        """
+        Returns the shared packed parse forest of every parse, rooted at the start symbol over the whole input, or None
+        if there is no valid parse. Build the parser with packed=True for the chart itself to stay polynomial on highly
+        ambiguous input; otherwise the forest still shares nodes but is read from a chart holding every derivation.
+        """
+        if not any(self.chart):
+            self.parse()
+        nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node] = {}
+        intermediates: Dict[Tuple[int, int, int, int], Intermediate_Node] = {}
+        prefixes: Dict[Tuple[int, int], Optional[Forest_Node]] = {}
+        root = None
+        for rule in self.chart[-1]:
+            if rule.lhs == self.start_symbol and rule.start_index == 0 \
+                    and rule.current_index == len(self.input_tokens) and rule.is_completed():
+                root = _run(self.__sppf_node(rule, nodes, intermediates, prefixes))
+        return root
 
+    def __sppf_symbol(self, symbol: Union[int, Token], token: Token, start_index: int, end_index: int,
+                      nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node]) -> Symbol_Node:
+        key = (symbol, start_index, end_index)
+        if key not in nodes:
+            nodes[key] = Symbol_Node(token, start_index, end_index)
+        return nodes[key]
 
+    def __sppf_node(self, rule: Rule, nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node],
+                    intermediates: Dict[Tuple[int, int, int, int], Intermediate_Node],
+                    prefixes: Dict[Tuple[int, int], Optional[Forest_Node]]) -> _Call:
+        # The node of the completed rule. This and the helpers it calls are run by _run, so yield the nodes they need.
+        if rule.index is None:
+            raise ValueError('SPPF requested for a rule that is not in the chart')
+        symbol = self.grammar.symbol_of(rule)
+        known = (symbol, rule.start_index, rule.current_index) in nodes
+        node = self.__sppf_symbol(symbol, rule.lhs, rule.start_index, rule.current_index, nodes)
+        if rule.production is None:
+            # Scanned rules - preterminals get the input token as their only child, terminals are leaves themselves
+            if not known and not self.grammar.terminal[symbol]:
+                leaf = self.__sppf_symbol(-1, rule.rhs[0], rule.start_index, rule.current_index, nodes)
+                node.add_alternative(None, (leaf,))
+            return node
+        if rule.index in prefixes:
+            return node
+        # Registered before recursing so cyclic derivations end at the node already being built
+        prefixes[rule.index] = node
+        for children in (yield self.__sppf_derivations(rule, nodes, intermediates, prefixes)):
+            self.__sppf_alternative(node, rule.production, children, nodes)
+        return node
 
+    def __sppf_alternative(self, node: Symbol_Node, production: int, children: Tuple[Forest_Node, ...],
+                           nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node]) -> None:
+        # Unit rules an optimizer collapsed into the production get back their symbol nodes, spanning the same input
+        chain = self.grammar.unit_chains.get(production)
+        if not chain:
+            node.add_alternative(self.grammar.rules[production], children)
+            return
+        inner_rule = Rule(chain[-1], self.grammar.rules[production].rhs)
+        for position in range(len(chain) - 1, -1, -1):
+            symbol = chain[position]
+            # Collapsed symbols are not in the grammar's symbol table, so their nodes are keyed by the symbol itself
+            unit_node = self.__sppf_symbol(symbol, symbol, node.start_index, node.end_index, nodes)
+            unit_node.add_alternative(inner_rule, children)
+            children = (unit_node,)
+            inner_rule = Rule(chain[position - 1], [symbol]) if position else Rule(node.symbol, [symbol])
+        node.add_alternative(inner_rule, children)
 
+    def __sppf_derivations(self, rule: Rule, nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node],
+                           intermediates: Dict[Tuple[int, int, int, int], Intermediate_Node],
+                           prefixes: Dict[Tuple[int, int], Optional[Forest_Node]]) -> _Call:
+        # The binarised children of each of the rule's derivations - the node of the rhs before the last symbol before
+        # the dot, if there is one, and the node of that symbol. Derivations giving the same nodes are merged by the
+        # node they are added to, so each takes constant space there.
+        result: List[Tuple[Forest_Node, ...]] = []
+        for previous_rule, updated_rule in self.derivations(rule):
+            if updated_rule is None:
+                result.append(())
+                continue
+            child = yield self.__sppf_child(rule, previous_rule, updated_rule, nodes, intermediates, prefixes)
+            prefix = yield self.__sppf_prefix(self.get_rule(updated_rule), nodes, intermediates, prefixes)
+            result.append((child,) if prefix is None else (prefix, child))
+        return result
 
+    def __sppf_prefix(self, rule: Rule, nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node],
+                      intermediates: Dict[Tuple[int, int, int, int], Intermediate_Node],
+                      prefixes: Dict[Tuple[int, int], Optional[Forest_Node]]) -> _Call:
+        # The node deriving the rhs before the rule's dot - None for an empty one, the symbol node of a single symbol,
+        # and otherwise the intermediate node of the rule's production, dot and span
+        if rule.index is None:
+            raise ValueError('SPPF requested for a rule that is not in the chart')
+        if rule.index in prefixes:
+            return prefixes[rule.index]
+        prefix: Optional[Forest_Node] = None
+        if rule.dot_index == 1:
+            symbol = self.grammar.rhs[rule.production][0]
+            prefix = self.__sppf_symbol(symbol, rule.rhs[0], rule.start_index, rule.current_index, nodes)
+        elif rule.dot_index > 1:
+            key = (rule.production, rule.dot_index, rule.start_index, rule.current_index)
+            if key not in intermediates:
+                intermediates[key] = Intermediate_Node(self.grammar.rules[rule.production], rule.dot_index,
+                                                       rule.start_index, rule.current_index)
+            prefix = intermediates[key]
+        prefixes[rule.index] = prefix
+        # A single symbol's node gets its alternatives from the child derivations add to it
+        for children in (yield self.__sppf_derivations(rule, nodes, intermediates, prefixes)):
+            if isinstance(prefix, Intermediate_Node):
+                prefix.add_alternative(children)
+        return prefix
 
+    def __sppf_child(self, sibling: Rule, previous_rule: Optional[Tuple[int, int]], updated_rule: Tuple[int, int],
+                     nodes: Dict[Tuple[Union[int, Token], int, int], Symbol_Node],
+                     intermediates: Dict[Tuple[int, int, int, int], Intermediate_Node],
+                     prefixes: Dict[Tuple[int, int], Optional[Forest_Node]]) -> _Call:
+        if previous_rule is None:
+            symbol = self.grammar.rhs[sibling.production][sibling.dot_index - 1]
+            empty_node = self.__sppf_symbol(symbol, sibling.rhs[sibling.dot_index - 1], sibling.current_index,
+                                            sibling.current_index, nodes)
+            empty_node.add_alternative(None, ())
+            return empty_node
+        child = self.get_rule(previous_rule)
+        child_node = yield self.__sppf_node(child, nodes, intermediates, prefixes)
+        for link in self.__leo_links(child, updated_rule):
+            link_node = self.__sppf_symbol(self.grammar.lhs[link.production], link.lhs, link.start_index,
+                                           sibling.current_index, nodes)
+            prefix = yield self.__sppf_prefix(link, nodes, intermediates, prefixes)
+            self.__sppf_alternative(link_node, link.production,
+                                    (child_node,) if prefix is None else (prefix, child_node), nodes)
+            child_node = link_node
+        return child_node
 
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Yields the printed chart one line at a time, so a large chart can be written out without building one string
+        """
+        for index, row in enumerate(self.chart):
+            yield f"Row {index}: {'ℇ' if index <= 0 else self.input_tokens[index - 1]}"
+            for rule in row:
+                yield str(rule)
 
+    def __str__(self) -> str:
+        return '\n'.join(self.iter_lines())
 
 
 
+if __name__ =='__main__':
+    parser = ArgumentParser(description='Parse a grammar and generate corresponding trees')
+    parser.add_argument('-g', '--grammar-file', help='Read a grammar file written in EBNF')
+    parser.add_argument('-s', '--start-symbol', help='The start symbol for the grammar, default S', default='S')
+    parser.add_argument('--leo', action='store_true', help="Use Leo's optimization for right recursive rules")
+    parser.add_argument('--compact', action='store_true', help='Store the chart in arrays, using less memory')
+    parser.add_argument('--lookahead', action='store_true',
+                        help='Only predict rules that can begin with the next token, keeping the chart small')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Remove useless symbols and collapse unit rules before parsing, keeping the same trees')
+    parser.add_argument('--no-cache', action='store_true', help='Compile the grammar file without the grammar cache')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Compile the grammar file and refresh its cache')
+    parser.add_argument('--cache-dir', help='The directory of the grammar cache, default ~/.cache/earley_parser')
+    parser.add_argument('--stats', action='store_true', help='Print the counters and timings of the parse as JSON')
+    parser.add_argument('--batch', action='store_true',
+                        help='Parse each line of the input file as its own sentence, printing one tree per line')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='Parse each line as --batch does, streaming one JSON object per line')
+    parser.add_argument('--lexer', action='store_true',
+                        help="Split the input into the grammar's terminals, which may be several words or punctuation, "
+                             'rather than on whitespace')
+    parser.add_argument('--workers', type=int, help='The number of processes parsing a batch, default one per CPU')
+    parser.add_argument('input_file', help='File containing the string to be parsed')
 
+    args = parser.parse_args()
 
+    if args.grammar_file:
+        # Imported here as Grammar_Cache parses grammars with this module's Parser
+        from Grammar_Cache import Grammar_Cache, compile_ebnf
+        if args.no_cache:
+            with open(args.grammar_file) as grammar_file:
+                new_grammar = compile_ebnf(grammar_file.read())
+        else:
+            new_grammar = Grammar_Cache(args.cache_dir).load(args.grammar_file, rebuild=args.rebuild_cache)
+    else:
+        import simple_sentence
+        new_grammar = simple_sentence.grammar
 
+    start_symbol = args.start_symbol
 
+    if args.optimize:
+        from Grammar_Optimizer import Grammar_Optimizer
+        new_grammar = Grammar_Optimizer(new_grammar, Token(start_symbol)).optimize()
+    elif not isinstance(new_grammar, CompiledGrammar):
+        # Compiled once, so a lexer's tokens are tagged with the ids of the grammar they are parsed with
+        new_grammar = CompiledGrammar(new_grammar)
 
+    if args.batch or args.jsonl:
+        from Batch import iter_parse, write_json_lines
+        with open(args.input_file) as input_file:
+            # Lines are read lazily and results written as they arrive, so memory use does not grow with the input
+            sentences = (line.rstrip('\n') for line in input_file)
+            results = iter_parse(sentences, new_grammar, Token(start_symbol), args.workers,
+                                 lex=args.lexer, leo=args.leo, compact=args.compact, lookahead=args.lookahead)
+            if args.jsonl:
+                write_json_lines(results, sys.stdout)
+            else:
+                for result in results:
+                    # Failed sentences print an empty line, so output lines still match input lines
+                    print(result.tree or '')
+                    if result.error:
+                        print(f'Line {result.index + 1}: {result.error}', file=sys.stderr)
+    else:
+        with open(args.input_file) as input_file:
+            if args.lexer:
+                tokens = Grammar_Lexer(new_grammar).tokenize(input_file.read())
+            else:
+                tokens = Simple_Tokenizer(input_file.read()).tokenize()
+            earley_parser = Parser(new_grammar, Token(start_symbol), tokens, leo=args.leo, compact=args.compact,
+                                   lookahead=args.lookahead, timings=args.stats)
 
+        parse_error = earley_parser.parse()
+        sys.stdout.writelines(f'{line}\n' for line in earley_parser.iter_lines())
+        if parse_error:
+            print(parse_error, file=sys.stderr)
+        if earley_parser.stats is not None:
+            print(json.dumps(earley_parser.stats.to_dict()), file=sys.stderr)
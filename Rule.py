@@ -1,4 +1,5 @@
-from typing import Any, Generator, Iterable, Optional, Tuple
+from typing import Any, Dict, Generator, Iterable, Optional, Tuple
+from weakref import WeakValueDictionary
 
 
 class Token:
@@ -13,17 +14,52 @@ class Token:
 
     Tokens can either be pre-tagged with a type, which will then be used by Parser, or have type None, in which
     case the Parser will try to infer their type based on their value and its terminal ruleset.
+
+    Tokens are interned - Token(type, value) returns the same instance for the same type and value for as long as it
+    is alive, so tokens are shared and must not be changed. Tokens that compare equal share one canonical token, the
+    terminal itself or the type with no value, which makes comparing them an identity check.
     """
+    __slots__ = ('token_type', 'value', '_canonical', '_hash', '__weakref__')
+    _interned: 'WeakValueDictionary[Tuple[type, str, Optional[str]], Token]' = WeakValueDictionary()
+
     token_type: str
     value: Optional[str]
+    _canonical: 'Token'
+    _hash: int
+
+    def __new__(cls, token_type: str, value: Optional[str]=None) -> 'Token':
+        key = (cls, token_type, value)
+        token = cls._interned.get(key)
+        if token is None:
+            token = super().__new__(cls)
+            token.token_type = token_type
+            token.value = value
+            if token_type == '_TERMINAL' or value is None:
+                token._canonical = token
+                token._hash = hash(value) if token_type == '_TERMINAL' else hash(token_type)
+            else:
+                token._canonical = cls(token_type)
+                token._hash = token._canonical._hash
+            cls._interned[key] = token
+        return token
 
     def __init__(self, token_type: str, value: Optional[str]=None):
-        self.token_type = token_type
-        self.value = value
+        # Everything is set once, by __new__, when the token is first interned
+        pass
+
+    def __reduce__(self) -> Tuple[type, Tuple[Any, ...]]:
+        # Unpickled and copied tokens are interned again rather than duplicated
+        return self.__class__, (self.token_type, self.value)
 
     def is_terminal(self) -> bool:
         return self.token_type == '_TERMINAL'
 
+    def retyped(self, token_type: str) -> 'Token':
+        """
+        Returns the token with the same value as this one and the given type, ex. a word tagged with its preterminal
+        """
+        return self if token_type == self.token_type else Token(token_type, value=self.value)
+
     def __str__(self) -> str:
         if self.token_type == "_TERMINAL":
             return f'"{self.value}"'
@@ -32,16 +68,57 @@ class Token:
         return self.token_type
 
     def __eq__(self, other: Any) -> bool:
-        if not isinstance(other, self.__class__):
-            return False
-        if self.token_type == '_TERMINAL':
-            return other.token_type == self.token_type and self.value == other.value
-        return other.token_type == self.token_type
+        return self is other or isinstance(other, Token) and self._canonical is other._canonical
 
     def __hash__(self) -> int:
-        if self.token_type == '_TERMINAL':
-            return hash(self.value)
-        return hash(self.token_type)
+        return self._hash
+
+
+class Located_Token(Token):
+    """
+    A token read from a source text, which remembers where it was read, so errors about it can point there
+
+    Attributes:
+        line    The line the token starts on, counting from 1
+        column  The column the token starts at, counting from 1
+
+    Located tokens are not interned, as each has its own location, but they compare and hash as the Token of the same
+    type and value, so they parse exactly as it does.
+    """
+    __slots__ = ('line', 'column')
+    _types: Dict[str, Token] = {}
+
+    line: int
+    column: int
+
+    def __new__(cls, token_type: str, value: Optional[str]=None, line: int=0, column: int=0) -> 'Located_Token':
+        token = object.__new__(cls)
+        token.token_type = token_type
+        token.value = value
+        if token_type == '_TERMINAL' or value is None:
+            canonical = Token(token_type, value)
+        else:
+            # Looked up once per type rather than interning a plain token for every value read
+            canonical = cls._types.get(token_type) or cls._types.setdefault(token_type, Token(token_type))
+        token._canonical = canonical
+        token._hash = canonical._hash
+        token.line = line
+        token.column = column
+        return token
+
+    def __init__(self, token_type: str, value: Optional[str]=None, line: int=0, column: int=0):
+        pass
+
+    def __reduce__(self) -> Tuple[type, Tuple[Any, ...]]:
+        return self.__class__, (self.token_type, self.value, self.line, self.column)
+
+    def retyped(self, token_type: str) -> 'Token':
+        if token_type == self.token_type:
+            return self
+        return Located_Token(token_type, self.value, self.line, self.column)
+
+    def location(self) -> str:
+        return f'line {self.line}, column {self.column}'
 
 
 class Rule:
@@ -53,6 +130,7 @@ class Rule:
         rhs             The right hand side of the rule as a List, such as [NP, VP] in the above
         start_index     The index of the start of the match for the current token
         current_index   The current index of the parser - the location of the 'dot'
+        production      The id of the grammar production this rule instantiates, None for scanned rules
     """
     lhs: Token
     rhs: Tuple[Token, ...]
@@ -62,11 +140,12 @@ class Rule:
     index: Optional[Tuple[int, int]]
     previous_rule: Optional[Tuple[int, int]]
     updated_rule: Optional[Tuple[int, int]]
+    production: Optional[int]
 
 
     def __init__(self, lhs: Token, rhs: Iterable[Token], start_index: int=0, current_index: int=0, dot_index: int=0,
                  index: Optional[Tuple[int, int]]=None, previous_rule: Optional[Tuple[int, int]]=None,
-                 updated_rule: Optional[Tuple[int, int]]=None):
+                 updated_rule: Optional[Tuple[int, int]]=None, production: Optional[int]=None):
         self.lhs = lhs
         self.rhs = tuple(rhs)
         self.start_index = start_index
@@ -75,6 +154,7 @@ class Rule:
         self.index = index
         self.previous_rule = previous_rule
         self.updated_rule = updated_rule
+        self.production = production
 
     def get_current_token(self) -> Optional[Token]:
         try:
@@ -96,10 +176,11 @@ class Rule:
         )
         if self.dot_index == len(self.rhs):
             rhs_str += '•'
-        if not self.previous_rule:
+        if self.updated_rule:
+            # rules advanced over a nullable symbol have no completed rule to point to
+            suffix = f"{outline_form(self.previous_rule) or 'ℇ'}/{outline_form(self.updated_rule)}"
+        elif not self.previous_rule:
             suffix = "scan"
-        elif self.updated_rule:
-            suffix = f"{outline_form(self.previous_rule)}/{outline_form(self.updated_rule)}"
         else:
             suffix = f"from {outline_form(self.previous_rule)}"
         return f'{outline_form(self.index):3} {str(self.lhs):10} → {rhs_str:20} [{self.start_index:2}, {self.current_index:2}] {suffix}'
@@ -0,0 +1,78 @@
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# The phases of an Earley parse, named as the parser reports them
+PHASES = ('predict', 'scan', 'complete', 'skip')
+
+
+class Parser_Stats:
+    """
+    Counters for one parse, kept by parsers built with stats=True
+
+    Attributes:
+        inserts     The rules each phase tried to insert into the chart - the predictions, scans, completions and
+                    nullable skips made
+        duplicates  The inserts of each phase finding an equivalent rule already in its row, so rejected, or recorded as
+                    a link by packed parsers
+        timings     The seconds spent in each phase, None unless the parser was built with timings=True
+        row_items   The number of rules in each row processed so far
+
+    Phases are predict, including the start rules, scan, complete, including Leo completions, and skip, the rules
+    advanced over nullable symbols.
+    """
+
+    inserts: Dict[str, int]
+    duplicates: Dict[str, int]
+    timings: Optional[Dict[str, float]]
+    row_items: List[int]
+
+    def __init__(self, timed: bool=False) -> None:
+        self.inserts = dict.fromkeys(PHASES, 0)
+        self.duplicates = dict.fromkeys(PHASES, 0)
+        self.timings = dict.fromkeys(PHASES, 0.0) if timed else None
+        self.row_items = []
+
+    def record(self, phase: str, duplicate: bool) -> None:
+        """
+        Counts a rule the phase tried to insert, and whether an equivalent rule was already in its row
+        """
+        self.inserts[phase] += 1
+        if duplicate:
+            self.duplicates[phase] += 1
+
+    def timed(self, phase: str, method: Callable[..., None], *args: Any) -> None:
+        """
+        Calls the method with the arguments, adding the time it takes to the phase's
+        """
+        start = perf_counter()
+        method(*args)
+        if self.timings is not None:
+            self.timings[phase] += perf_counter() - start
+
+    def largest_rows(self, count: int=5) -> List[Tuple[int, int]]:
+        """
+        Returns the (row index, number of rules) pairs of the largest rows, largest first
+        """
+        return sorted(enumerate(self.row_items), key=lambda row: row[1], reverse=True)[:count]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'inserts': dict(self.inserts),
+            'duplicates': dict(self.duplicates),
+            'timings': dict(self.timings) if self.timings is not None else None,
+            'rows': len(self.row_items),
+            'items': sum(self.row_items),
+            'largest_rows': self.largest_rows(),
+            'row_items': list(self.row_items),
+        }
+
+    def __str__(self) -> str:
+        lines = []
+        for phase in PHASES:
+            line = f'{phase:10} {self.inserts[phase]:10} inserted {self.duplicates[phase]:10} duplicates'
+            if self.timings is not None:
+                line += f' {self.timings[phase]:10.4f} s'
+            lines.append(line)
+        largest = ', '.join(f'row {row}: {items}' for row, items in self.largest_rows())
+        lines.append(f'{sum(self.row_items)} items in {len(self.row_items)} rows, largest {largest or "none"}')
+        return '\n'.join(lines)
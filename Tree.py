@@ -1,4 +1,4 @@
-from typing import Generic, List, Optional, TypeVar
+from typing import Generic, List, Optional, Tuple, TypeVar, Union
 
 T = TypeVar('T')
 
@@ -20,6 +20,28 @@ class Node(Generic[T]):
         node.parent = self
         self.children.append(node)
 
+    def bracketed(self) -> str:
+        """
+        Returns the tree on one line in labelled bracket notation, ex. (S (NP Jen) (VP saw (NP the man)))
+        """
+        parts: List[str] = []
+        # Nodes still to write, each with the text before it, and the closing brackets of the nodes they end, so deep
+        # trees need no recursion
+        stack: List[Union[Tuple['Node[T]', str], str]] = [(self, '')]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+                continue
+            node, separator = item
+            if not node.children:
+                parts.extend((separator, str(node.value)))
+                continue
+            parts.extend((separator, '(', str(node.value)))
+            stack.append(')')
+            stack.extend((child, ' ') for child in reversed(node.children))
+        return ''.join(parts)
+
     def __str__(self) -> str:
         return str(self.value)
 